@@ -1,6 +1,7 @@
 import os
 import re
 import json
+import time
 import torch
 import librosa
 import soundfile
@@ -12,64 +13,239 @@ import torch
 
 from . import utils
 from . import commons
+from . import metrics
+from . import compiled
+from . import quantize as quantization
 from .models import SynthesizerTrn
+from .cache import cache_key_hash
+from .text import get_bert_provider, DEFAULT_BERT_PROVIDER
+from .text.symbols import symbols, num_tones, num_languages
 from .split_utils import split_sentence
 from .mel_processing import spectrogram_torch, spectrogram_torch_conv
 from .download_utils import load_or_download_config, load_or_download_model
 
+# training config of the repo, used by `TTS.from_config`
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'configs', 'config.json')
+
+# short sentences for `TTS.warmup`
+WARMUP_TEXTS = {
+    'EN': "Hello, this is a test.",
+    'ES': "Hola, esto es una prueba.",
+    'SP': "Hola, esto es una prueba.",
+    'FR': "Bonjour, ceci est un test.",
+    'ZH': "你好，这是一个测试。",
+    'ZH_MIX_EN': "你好，这是一个测试。",
+    'JP': "こんにちは、これはテストです。",
+    'KR': "안녕하세요, 테스트입니다.",
+}
+
 class TTS(nn.Module):
     def __init__(self, 
                 language,
                 device='auto',
                 use_hf=True,
                 config_path=None,
-                ckpt_path=None):
+                ckpt_path=None,
+                feature_cache=None,
+                audio_cache=None,
+                backend='eager',
+                quantize=None):
         super().__init__()
         if device == 'auto':
             device = 'cpu'
-            if torch.cuda.is_available(): device = 'cuda'
-            if torch.backends.mps.is_available(): device = 'mps'
+            # the int8 kernels only exist on the CPU
+            if torch.cuda.is_available() and not quantize: device = 'cuda'
+            if torch.backends.mps.is_available() and not quantize: device = 'mps'
         if 'cuda' in device:
             assert torch.cuda.is_available()
 
         # config_path = 
         hps = load_or_download_config(language, use_hf=use_hf, config_path=config_path)
 
-        num_languages = hps.num_languages
-        num_tones = hps.num_tones
-        symbols = hps.symbols
+        # load state_dict; a checkpoint of `utils.save_inference_checkpoint` is loaded
+        # into the inference build, a training one is converted after loading
+        checkpoint_dict = load_or_download_model(language, device, use_hf=use_hf, ckpt_path=ckpt_path)
+        model = self.build_model(hps, inference=checkpoint_dict.get('inference', False)).to(device)
+        model.load_state_dict(checkpoint_dict['model'], strict=True)
+        model.prepare_for_inference()
+
+        self._setup(model, hps, language, device, utils.state_dict_checksum(checkpoint_dict['model']),
+                    feature_cache, audio_cache, backend, quantize)
 
+    @staticmethod
+    def build_model(hps, inference=False):
+        """
+        `SynthesizerTrn` of the config `hps` in eval mode, with untrained weights.
+        With `inference`, its inference build, see `SynthesizerTrn.prepare_for_inference`.
+        """
         model = SynthesizerTrn(
-            len(symbols),
+            len(hps.symbols),
             hps.data.filter_length // 2 + 1,
             hps.train.segment_size // hps.data.hop_length,
             n_speakers=hps.data.n_speakers,
-            num_tones=num_tones,
-            num_languages=num_languages,
+            num_tones=hps.num_tones,
+            num_languages=hps.num_languages,
             **hps.model,
-        ).to(device)
+        )
+        if inference:
+            model.prepare_for_inference()
+        return model.eval()
 
-        model.eval()
+    def _setup(self, model, hps, language, device, weights_checksum, feature_cache=None, audio_cache=None,
+               backend='eager', quantize=None):
+        if backend not in compiled.BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {list(compiled.BACKENDS)}")
+        if quantize and (device != 'cpu' or backend != 'eager'):
+            raise ValueError(f"quantize='{quantize}' needs device='cpu' and backend='eager'")
         self.model = model
-        self.symbol_to_id = {s: i for i, s in enumerate(symbols)}
+        self.symbol_to_id = {s: i for i, s in enumerate(hps.symbols)}
         self.hps = hps
         self.device = device
-    
-        # load state_dict
-        checkpoint_dict = load_or_download_model(language, device, use_hf=use_hf, ckpt_path=ckpt_path)
-        self.model.load_state_dict(checkpoint_dict['model'], strict=True)
-        
+
         language = language.split('_')[0]
         self.language = 'ZH_MIX_EN' if language == 'ZH' else language # we support a ZH_MIX_EN model
 
+        # BERT provider used when a request does not ask for one, see `melo.text.BERT_PROVIDERS`
+        self.bert_provider = getattr(hps.data, "bert_provider", None) or DEFAULT_BERT_PROVIDER
+
+        # text features only depend on the language (which fixes the BERT model),
+        # the symbol table and the text settings of the config; the feature cache
+        # adds the BERT provider to its keys
+        self.feature_cache = feature_cache
+        self.frontend_id = utils.fingerprint(
+            self.language, hps.symbols, hps.data.add_blank, getattr(hps.data, "disable_bert", False)
+        )
+        # synthesized audio also depends on the weights
+        self.audio_cache = audio_cache
+        self.model_id = utils.fingerprint(self.frontend_id, weights_checksum)
+
+        # 'compile' runs the acoustic model through torch.compile, with the phones
+        # padded to a few lengths so that each of them is compiled once
+        self.backend = backend
+        self.text_buckets = None
+        if backend == 'compile':
+            compiled.compile_model(model)
+            self.text_buckets = compiled.TEXT_BUCKETS
+
+        # 'int8' quantizes the attention layers of the acoustic model and, unless the
+        # config picks another provider, the BERT model; 'int8_decoder' the decoder too
+        self.quantize = quantize
+        if quantize:
+            quantization.quantize_model(model, quantize)
+            if self.bert_provider == 'bert':
+                # every mode quantizes BERT to int8
+                self.bert_provider = 'bert_int8'
+            self.model_id = utils.fingerprint(self.model_id, quantize)
+
+    @classmethod
+    def from_model(cls, model, hps, language, device='cpu', feature_cache=None, audio_cache=None, backend='eager',
+                   quantize=None):
+        """
+        Wrap an already loaded `SynthesizerTrn`, e.g. one whose weights live in shared
+        memory, see `worker_pool`.
+        """
+        tts = cls.__new__(cls)
+        nn.Module.__init__(tts)
+        tts._setup(model.eval(), hps, language, device, utils.state_dict_checksum(model.state_dict()),
+                   feature_cache, audio_cache, backend, quantize)
+        return tts
+
+    @classmethod
+    def from_config(cls, language, config_path=None, device='cpu', seed=None, bert_provider='zeros', feature_cache=None,
+                    audio_cache=None, backend='eager', quantize=None):
+        """
+        `TTS` with randomly initialized weights, built from a config alone without
+        downloading anything, e.g. to benchmark the pipeline offline. The audio is noise.
+
+        `config_path` defaults to the training config of the repo; a config without a
+        symbol table gets the one of `melo.text.symbols`. `seed` makes the weights
+        reproducible. The default `bert_provider` stubs the BERT models with zero
+        features of the sizes they return (1024 for ZH, 768 otherwise), 'bert' loads
+        the real ones.
+        """
+        hps = utils.get_hparams_from_file(config_path or DEFAULT_CONFIG_PATH)
+        for key, value in [('symbols', symbols), ('num_tones', num_tones), ('num_languages', num_languages)]:
+            if key not in hps:
+                hps[key] = value
+        hps.data.bert_provider = bert_provider
+        with torch.random.fork_rng(devices=[]):
+            if seed is not None:
+                torch.manual_seed(seed)
+            model = cls.build_model(hps, inference=True)
+        return cls.from_model(model.to(device), hps, language, device, feature_cache, audio_cache, backend, quantize)
+
+    @staticmethod
+    def _fade_curves(n, mode):
+        t = (np.arange(n, dtype=np.float32) + 0.5) / n
+        if mode == 'linear':
+            return t, 1. - t
+        if mode == 'equal_power':
+            return np.sin(t * np.pi / 2), np.cos(t * np.pi / 2)
+        raise ValueError(f"Unknown crossfade mode '{mode}', expected 'linear' or 'equal_power'")
+
+    @staticmethod
+    def audio_numpy_concat(segment_data_list, sr, speed=1., gap=0.05, crossfade=None, crossfade_duration=0.01):
+        """
+        Concatenate audio segments into one preallocated float32 buffer, with `gap`
+        seconds of silence (scaled by 1 / speed) after every segment.
+
+        `crossfade` ('linear' or 'equal_power') smooths the joins over `crossfade_duration`
+        seconds: with a gap, every segment is faded in and out at its edges; with
+        gap=0, consecutive segments overlap and are crossfaded into each other.
+        """
+        segments = [np.asarray(s, dtype=np.float32).reshape(-1) for s in segment_data_list]
+        gap_len = int((sr * gap) / speed)
+        fade_len = int(sr * crossfade_duration) if crossfade else 0
+        overlaps = [0] * len(segments)
+        if fade_len and gap_len == 0:
+            for i in range(1, len(segments)):
+                overlaps[i] = min(fade_len, len(segments[i - 1]), len(segments[i]))
+
+        total = sum(len(s) for s in segments) + gap_len * len(segments) - sum(overlaps)
+        audio = np.zeros(total, dtype=np.float32)
+        pos = 0
+        for seg, overlap in zip(segments, overlaps):
+            if fade_len and gap_len:
+                n = min(fade_len, len(seg) // 2)
+                if n:
+                    fade_in, fade_out = TTS._fade_curves(n, crossfade)
+                    seg = seg.copy()
+                    seg[:n] *= fade_in
+                    seg[-n:] *= fade_out
+            if overlap:
+                pos -= overlap
+                fade_in, fade_out = TTS._fade_curves(overlap, crossfade)
+                audio[pos:pos + overlap] *= fade_out
+                audio[pos:pos + overlap] += seg[:overlap] * fade_in
+                audio[pos + overlap:pos + len(seg)] = seg[overlap:]
+            else:
+                audio[pos:pos + len(seg)] = seg
+            pos += len(seg) + gap_len
+        return audio
+
+    @staticmethod
+    def is_deterministic(sdp_ratio, noise_scale, noise_scale_w, seed=None):
+        """
+        Whether `infer` output only depends on its inputs for these sampling parameters.
+        """
+        return seed is not None or (noise_scale == 0 and (noise_scale_w == 0 or sdp_ratio == 0))
+
+    def audio_cache_key(self, text, speaker_id, speed, sdp_ratio, noise_scale, noise_scale_w, seed=None, **options):
+        """
+        Key of a synthesized waveform in the audio cache, also used as HTTP ETag.
+        `options` are further arguments that change the output, e.g. the gap length.
+        """
+        return cache_key_hash(
+            [self.model_id, text, int(speaker_id), float(speed), float(sdp_ratio),
+             float(noise_scale), float(noise_scale_w), seed, sorted(options.items())]
+        )
+
     @staticmethod
-    def audio_numpy_concat(segment_data_list, sr, speed=1.):
-        audio_segments = []
-        for segment_data in segment_data_list:
-            audio_segments += segment_data.reshape(-1).tolist()
-            audio_segments += [0] * int((sr * 0.05) / speed)
-        audio_segments = np.array(audio_segments).astype(np.float32)
-        return audio_segments
+    def sentence_seeds(seed, n):
+        """
+        Sentence i of a text is sampled with seed + i, None leaves sampling to the global RNG.
+        """
+        return [None if seed is None else seed + i for i in range(n)]
 
     @staticmethod
     def split_sentences_into_pieces(text, language, quiet=False):
@@ -80,8 +256,185 @@ class TTS(nn.Module):
             print(" > ===========================")
         return texts
 
-    def tts_to_file(self, text, speaker_id, output_path=None, sdp_ratio=0.2, noise_scale=0.6, noise_scale_w=0.8, speed=1.0, pbar=None, format=None, position=None, quiet=False,):
+    def text_to_features(self, text, bert_provider=None):
+        return self.texts_to_features([text], bert_provider)[0]
+
+    def texts_to_features(self, texts, bert_provider=None):
+        """
+        `text_to_features` of several sentences, with one batched BERT pass for all of them.
+        """
         language = self.language
+        if language in ['EN', 'ZH_MIX_EN']:
+            texts = [re.sub(r'([a-z])([A-Z])', r'\1 \2', text) for text in texts]
+        return utils.get_texts_for_tts_infer(
+            texts, language, self.hps, self.device, self.symbol_to_id,
+            cache=self.feature_cache, cache_id=self.frontend_id, bert_provider=bert_provider or self.bert_provider,
+        )
+
+    def load_frontend(self):
+        """
+        Load the lazily initialized parts of the text frontend (the model of the default
+        BERT provider) now. Call it before synthesizing from several threads; the
+        acoustic model is only read during inference and can be shared by all of them.
+        Returns the BERT model, None for providers without one.
+        """
+        if not getattr(self.hps.data, "disable_bert", False):
+            return get_bert_provider(self.bert_provider).load(self.language, self.device)
+
+    def unload_frontend(self):
+        if not getattr(self.hps.data, "disable_bert", False):
+            get_bert_provider(self.bert_provider).unload(self.language)
+
+    def frontend_key(self):
+        """
+        The BERT model `load_frontend` loads, equal for models sharing it (ES and SP,
+        ZH and ZH_MIX_EN); None without one.
+        """
+        if not getattr(self.hps.data, "disable_bert", False):
+            return get_bert_provider(self.bert_provider).model_key(self.language)
+
+    def warmup(self, text=None):
+        """
+        Synthesize one short sentence, so that lazy initialization (BERT and G2P
+        models, numba compilation, cuDNN autotuning) happens now and not in the
+        first request. Returns the time it took in seconds.
+        """
+        start = time.perf_counter()
+        text = text or WARMUP_TEXTS.get(self.language, WARMUP_TEXTS['EN'])
+        speaker_id = next(iter(self.hps.data.spk2id.values()), 0)
+        self.tts_to_file(text, speaker_id, None, quiet=True)
+        return time.perf_counter() - start
+
+    def _pad_features(self, features):
+        device = self.device
+        lengths = [phones.size(0) for _, _, phones, _, _ in features]
+        batch_size, max_len = len(features), max(lengths)
+        if self.text_buckets:
+            max_len = commons.bucket_length(max_len, self.text_buckets)
+
+        x_tst = torch.zeros(batch_size, max_len, dtype=torch.long)
+        tones = torch.zeros(batch_size, max_len, dtype=torch.long)
+        lang_ids = torch.zeros(batch_size, max_len, dtype=torch.long)
+        # BERT features may already be on the model's device, pad them there
+        bert = torch.zeros(batch_size, features[0][0].size(0), max_len, device=device)
+        ja_bert = torch.zeros(batch_size, features[0][1].size(0), max_len, device=device)
+        for i, (b, jb, p, t, l) in enumerate(features):
+            x_tst[i, :p.size(0)] = p
+            tones[i, :t.size(0)] = t
+            lang_ids[i, :l.size(0)] = l
+            bert[i, :, :b.size(-1)] = b.to(device)
+            ja_bert[i, :, :jb.size(-1)] = jb.to(device)
+        x_tst_lengths = torch.LongTensor(lengths)
+        return tuple(t.to(device) for t in (x_tst, x_tst_lengths, tones, lang_ids)) + (bert, ja_bert)
+
+    @staticmethod
+    def _generators(seeds):
+        if seeds is None or all(s is None for s in seeds):
+            return None
+        return [None if s is None else torch.Generator().manual_seed(int(s)) for s in seeds]
+
+    def infer_batch(self, features, speaker_ids, sdp_ratio=0.2, noise_scale=0.6, noise_scale_w=0.8, speed=1.0, seeds=None,
+                    profiler=None):
+        """
+        Run the acoustic model once over a padded batch of sentences.
+
+        `features` is a list of (bert, ja_bert, phones, tones, lang_ids) tuples as returned by
+        `text_to_features`, `speaker_ids` a single speaker id or one id per sentence.
+        `seeds` optionally gives one seed per sentence; a seeded sentence gets the same
+        audio regardless of the device and of what it is batched with.
+        `profiler` (a `melo.profiler.Profiler`) records the stages of the acoustic model.
+        Returns one float32 waveform per sentence, in input order.
+        """
+        if not isinstance(speaker_ids, (list, tuple)):
+            speaker_ids = [speaker_ids] * len(features)
+        x_tst, x_tst_lengths, tones, lang_ids, bert, ja_bert = self._pad_features(features)
+
+        metrics.observe("batch_size", len(features), self.language)
+        with torch.no_grad(), metrics.language_scope(self.language):
+            o, _, y_mask, _ = self.model.infer(
+                    x_tst,
+                    x_tst_lengths,
+                    torch.LongTensor(speaker_ids).to(self.device),
+                    tones,
+                    lang_ids,
+                    bert,
+                    ja_bert,
+                    sdp_ratio=sdp_ratio,
+                    noise_scale=noise_scale,
+                    noise_scale_w=noise_scale_w,
+                    length_scale=1. / speed,
+                    generator=self._generators(seeds),
+                    profiler=profiler,
+                )
+            # every latent frame is upsampled to hop_length samples by the decoder
+            n_samples = (y_mask.sum([1, 2]).long() * self.hps.data.hop_length).tolist()
+            o = o[:, 0].data.cpu().float().numpy()
+        return [o[i, :n] for i, n in enumerate(n_samples)]
+
+    def _infer_by_length(self, features, speaker_id, batch_size, seeds, progress=None, **kwargs):
+        # group sentences of similar length so that padding stays small
+        order = sorted(range(len(features)), key=lambda i: features[i][2].size(0))
+        audio_list = [None] * len(features)
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            audios = self.infer_batch(
+                [features[i] for i in idx], speaker_id, seeds=[seeds[i] for i in idx], **kwargs
+            )
+            for i, audio in zip(idx, audios):
+                audio_list[i] = audio
+            # `progress` (an iterator over the sentences, e.g. a tqdm bar) advances
+            # by one item per finished sentence
+            if progress is not None:
+                for _ in idx:
+                    next(progress, None)
+        return audio_list
+
+    def tts_iter(self, text, speaker_id, sdp_ratio=0.2, noise_scale=0.6, noise_scale_w=0.8, speed=1.0, quiet=True, chunk_size=None, gap=0.05, seed=None, bert_provider=None):
+        """
+        Generator version of `tts_to_file`: yields one float32 chunk per sentence as soon
+        as it is synthesized, each followed by the inter-sentence silence that
+        `audio_numpy_concat` inserts, so the concatenated chunks equal the full output.
+
+        With `chunk_size` (in latent frames, 1 frame = hop_length samples) every sentence
+        is vocoded incrementally and yielded in blocks of that size instead, which cuts
+        the latency to first audio for long sentences. The silence then comes as a
+        separate chunk after each sentence.
+
+        `seed` makes the output reproducible, see `sentence_seeds`. `bert_provider`
+        overrides the default BERT provider of the model, e.g. 'zeros' for a faster frontend.
+        """
+        texts = self.split_sentences_into_pieces(text, self.language, quiet)
+        silence = np.zeros(int((self.hps.data.sampling_rate * gap) / speed), dtype=np.float32)
+        infer_kwargs = dict(sdp_ratio=sdp_ratio, noise_scale=noise_scale, noise_scale_w=noise_scale_w)
+        for t, sentence_seed in zip(texts, self.sentence_seeds(seed, len(texts))):
+            features = self.text_to_features(t, bert_provider)
+            if chunk_size:
+                x_tst, x_tst_lengths, tones, lang_ids, bert, ja_bert = self._pad_features([features])
+                speakers = torch.LongTensor([speaker_id]).to(self.device)
+                for block in self.model.infer_stream(
+                        x_tst, x_tst_lengths, speakers, tones, lang_ids, bert, ja_bert,
+                        chunk_size=chunk_size, length_scale=1. / speed,
+                        generator=self._generators([sentence_seed]), **infer_kwargs):
+                    yield block[0, 0].data.cpu().float().numpy()
+                yield silence
+            else:
+                audio = self.infer_batch([features], speaker_id, speed=speed, seeds=[sentence_seed], **infer_kwargs)[0]
+                yield np.concatenate([audio, silence])
+
+    def tts_to_file(self, text, speaker_id, output_path=None, sdp_ratio=0.2, noise_scale=0.6, noise_scale_w=0.8, speed=1.0, pbar=None, format=None, position=None, quiet=False, batch_size=1, gap=0.05, crossfade=None, seed=None, profiler=None, bert_provider=None):
+        language = self.language
+        bert_provider = bert_provider or self.bert_provider
+        cache_key = None
+        if self.audio_cache is not None and self.is_deterministic(sdp_ratio, noise_scale, noise_scale_w, seed):
+            cache_key = self.audio_cache_key(
+                text, speaker_id, speed, sdp_ratio, noise_scale, noise_scale_w, seed=seed, gap=gap, crossfade=crossfade,
+                bert=bert_provider,
+            )
+            audio = self.audio_cache.get(cache_key)
+            if audio is not None:
+                return self._write_audio(audio, output_path, format)
+
+        start = time.perf_counter()
         texts = self.split_sentences_into_pieces(text, language, quiet)
         audio_list = []
         if pbar:
@@ -93,42 +446,37 @@ class TTS(nn.Module):
                 tx = texts
             else:
                 tx = tqdm(texts)
-        for t in tx:
-            if language in ['EN', 'ZH_MIX_EN']:
-                t = re.sub(r'([a-z])([A-Z])', r'\1 \2', t)
-            device = self.device
-            bert, ja_bert, phones, tones, lang_ids = utils.get_text_for_tts_infer(t, language, self.hps, device, self.symbol_to_id)
-            with torch.no_grad():
-                x_tst = phones.to(device).unsqueeze(0)
-                tones = tones.to(device).unsqueeze(0)
-                lang_ids = lang_ids.to(device).unsqueeze(0)
-                bert = bert.to(device).unsqueeze(0)
-                ja_bert = ja_bert.to(device).unsqueeze(0)
-                x_tst_lengths = torch.LongTensor([phones.size(0)]).to(device)
-                del phones
-                speakers = torch.LongTensor([speaker_id]).to(device)
-                audio = self.model.infer(
-                        x_tst,
-                        x_tst_lengths,
-                        speakers,
-                        tones,
-                        lang_ids,
-                        bert,
-                        ja_bert,
-                        sdp_ratio=sdp_ratio,
-                        noise_scale=noise_scale,
-                        noise_scale_w=noise_scale_w,
-                        length_scale=1. / speed,
-                    )[0][0, 0].data.cpu().float().numpy()
-                del x_tst, tones, lang_ids, bert, ja_bert, x_tst_lengths, speakers
-                # 
-            audio_list.append(audio)
+        infer_kwargs = dict(
+            sdp_ratio=sdp_ratio, noise_scale=noise_scale, noise_scale_w=noise_scale_w, speed=speed, profiler=profiler
+        )
+        seeds = self.sentence_seeds(seed, len(texts))
+        if batch_size > 1:
+            # batched path: one BERT pass and a few padded forward passes instead of one per sentence
+            features = self.texts_to_features(texts, bert_provider)
+            progress = iter(tx)
+            audio_list = self._infer_by_length(
+                features, speaker_id, batch_size, seeds, progress=progress, **infer_kwargs
+            )
+            # closes the progress bar
+            for _ in progress:
+                pass
+        else:
+            for i, t in enumerate(tx):
+                features = [self.text_to_features(t, bert_provider)]
+                audio_list += self.infer_batch(features, speaker_id, seeds=seeds[i:i + 1], **infer_kwargs)
         torch.cuda.empty_cache()
-        audio = self.audio_numpy_concat(audio_list, sr=self.hps.data.sampling_rate, speed=speed)
+        audio = self.audio_numpy_concat(audio_list, sr=self.hps.data.sampling_rate, speed=speed, gap=gap, crossfade=crossfade)
+        metrics.observe(
+            "realtime_factor", len(audio) / self.hps.data.sampling_rate / (time.perf_counter() - start), language
+        )
+        if cache_key is not None:
+            self.audio_cache.put(cache_key, audio)
+        return self._write_audio(audio, output_path, format)
 
+    def _write_audio(self, audio, output_path=None, format=None):
         if output_path is None:
             return audio
-        else:
+        with metrics.timed("audio_encoding", self.language):
             if format:
                 soundfile.write(output_path, audio, self.hps.data.sampling_rate, format=format)
             else:
@@ -1,14 +1,26 @@
 import io
 import os
+import time
+import struct
+import asyncio
 import tempfile
 import logging
 
+import numpy as np
+import soundfile
 import gradio as gr
-from fastapi import FastAPI, Body, Depends
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, Body, Depends, Request
+from fastapi.responses import FileResponse, Response
 from pydantic import BaseModel
+from typing import Optional
 
+from melo import metrics
 from melo.api import TTS
+from melo.text import BERT_PROVIDERS
+from melo.cache import FeatureCache, AudioCache
+from melo.scheduler import InferenceScheduler
+from melo.worker_pool import WorkerPool, parse_affinity
+from melo.model_registry import ModelRegistry
 
 # ─── Configuration & Version Info ─────────────────────────────────────────────
 VERSION = os.getenv("APP_VERSION", "v0.0.3")
@@ -26,14 +38,118 @@ logger.info(f"Starting TTS UI+API App - Version: {VERSION}, Build: {BUILD_ID}")
 # ─── Load Your TTS Models ───────────────────────────────────────────────────────
 DEVICE = "auto"
 LANGUAGES = os.getenv("TTS_LANGUAGES", "EN,ES,FR,ZH,JP,KR").split(",")
-logger.info(f"Loading models for languages: {LANGUAGES}")
-models = {}
-for lang in LANGUAGES:
-    try:
-        models[lang] = TTS(language=lang, device=DEVICE)
-        logger.info(f"Loaded TTS model for {lang}")
-    except Exception as e:
-        logger.error(f"Failed to load model for {lang}: {e}")
+logger.info(f"Serving languages: {LANGUAGES}")
+# Phoneme/BERT features of repeated sentences are cached, shared by all models
+FEATURE_CACHE_SIZE = int(os.getenv("TTS_FEATURE_CACHE_SIZE", "256"))
+FEATURE_CACHE_DIR = os.getenv("TTS_FEATURE_CACHE_DIR") or None
+FEATURE_CACHE_MAX_MB = float(os.getenv("TTS_FEATURE_CACHE_MAX_MB", "1024"))
+feature_cache = None
+if FEATURE_CACHE_SIZE > 0:
+    feature_cache = FeatureCache(
+        FEATURE_CACHE_SIZE, cache_dir=FEATURE_CACHE_DIR, max_bytes=int(FEATURE_CACHE_MAX_MB * 2**20)
+    )
+# Whole waveforms of deterministic requests (seeded, or noise_scale=0 and noise_scale_w=0 or sdp_ratio=0)
+AUDIO_CACHE = os.getenv("TTS_AUDIO_CACHE", "lru")
+AUDIO_CACHE_MAX_MB = float(os.getenv("TTS_AUDIO_CACHE_MAX_MB", "256"))
+audio_cache = None
+if AUDIO_CACHE and AUDIO_CACHE != "none":
+    audio_cache = AudioCache(
+        AUDIO_CACHE,
+        max_items=int(os.getenv("TTS_AUDIO_CACHE_SIZE", "1024")),
+        max_bytes=int(AUDIO_CACHE_MAX_MB * 2**20),
+        cache_dir=os.getenv("TTS_AUDIO_CACHE_DIR") or None,
+    )
+# "compile" runs the acoustic models through torch.compile (see melo/compiled.py)
+BACKEND = os.getenv("TTS_BACKEND", "eager")
+# "int8" quantizes the models for CPU inference, "int8_decoder" the decoder too (see melo/quantize.py)
+QUANTIZE = os.getenv("TTS_QUANTIZE") or None
+# With TTS_POOL_WORKERS > 0 requests run in worker processes (see melo/worker_pool.py),
+# which hold their own text frontends and share the model weights with this process
+POOL_WORKERS = int(os.getenv("TTS_POOL_WORKERS", "0"))
+# Models are loaded on their first request, or in the background for the languages in
+# TTS_PRELOAD (default: all, "none" to disable). Least recently used models are dropped
+# beyond TTS_MAX_MODELS models or TTS_MODEL_MEMORY_MB of weights (0: no limit).
+PRELOAD = os.getenv("TTS_PRELOAD", ",".join(LANGUAGES))
+PRELOAD = [] if PRELOAD == "none" else [lang for lang in PRELOAD.split(",") if lang]
+models = ModelRegistry(
+    LANGUAGES,
+    lambda lang: TTS(language=lang, device=DEVICE, feature_cache=feature_cache, audio_cache=audio_cache, backend=BACKEND,
+                     quantize=QUANTIZE),
+    max_models=int(os.getenv("TTS_MAX_MODELS", "0")),
+    max_memory_mb=float(os.getenv("TTS_MODEL_MEMORY_MB", "0")),
+    # Gradio and API requests share the model, so the lazy BERT globals are loaded with it
+    frontend=not POOL_WORKERS,
+)
+if POOL_WORKERS:
+    # the worker processes need every model up front
+    models.warmup(LANGUAGES, background=False)
+else:
+    models.warmup(PRELOAD)
+
+# ─── Inference Scheduler ───────────────────────────────────────────────────────
+# Sentences of concurrent API requests are batched per language for up to
+# TTS_MAX_WAIT_MS milliseconds or TTS_MAX_BATCH_SIZE sentences, and run by
+# TTS_WORKERS_PER_LANGUAGE threads; TTS_THREADS_PER_WORKER sets the torch intra-op
+# thread count of the whole process, shared by all of them.
+MAX_BATCH_SIZE = int(os.getenv("TTS_MAX_BATCH_SIZE", "8"))
+MAX_WAIT_MS = float(os.getenv("TTS_MAX_WAIT_MS", "10"))
+WORKERS_PER_LANGUAGE = int(os.getenv("TTS_WORKERS_PER_LANGUAGE", "1"))
+THREADS_PER_WORKER = int(os.getenv("TTS_THREADS_PER_WORKER", "0")) or None
+scheduler = InferenceScheduler(
+    models, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+    num_workers=WORKERS_PER_LANGUAGE, num_threads=THREADS_PER_WORKER,
+)
+logger.info(
+    f"Inference scheduler: max_batch_size={MAX_BATCH_SIZE}, max_wait_ms={MAX_WAIT_MS}, "
+    f"workers_per_language={WORKERS_PER_LANGUAGE}, threads_per_worker={THREADS_PER_WORKER}"
+)
+
+# ─── Worker Process Pool ───────────────────────────────────────────────────────
+# TTS_POOL_WORKERS processes per language, TTS_POOL_AFFINITY overrides the count
+# per language ("EN:3,ZH:1"), TTS_POOL_THREADS sets torch threads per process.
+pool = None
+if POOL_WORKERS:
+    loaded_models = dict(models.loaded_items())
+    pool = WorkerPool(
+        loaded_models,
+        parse_affinity(os.getenv("TTS_POOL_AFFINITY"), list(loaded_models), POOL_WORKERS),
+        num_threads=int(os.getenv("TTS_POOL_THREADS", "0")) or None,
+        feature_cache_size=FEATURE_CACHE_SIZE,
+    )
+    logger.info(f"Worker pool started: workers={POOL_WORKERS}, affinity={os.getenv('TTS_POOL_AFFINITY')}")
+
+def synthesize_audio(language, text, speaker_id, **kwargs):
+    """
+    Blocking synthesis of a whole text through the worker pool, or the scheduler without one.
+    """
+    start = time.perf_counter()
+    if pool is not None:
+        audio = pool.synthesize(language, text, speaker_id, **kwargs)
+    else:
+        audio = scheduler.synthesize(language, text, speaker_id, **kwargs)
+    sr = models.get_hps(language).data.sampling_rate
+    metrics.observe("realtime_factor", len(audio) / sr / (time.perf_counter() - start), language)
+    return audio
+
+# ─── Metrics ───────────────────────────────────────────────────────────────────
+# Prometheus metrics at /tts/metrics, TTS_METRICS=0 switches the timing hooks off.
+# With worker processes, the per-stage timings of the workers are not collected.
+metrics_sink = None
+if os.getenv("TTS_METRICS", "1") != "0":
+    metrics_sink = metrics.PrometheusSink()
+    metrics_sink.add_gauge(
+        "queue_depth", "Sentences (or texts, with worker processes) waiting for inference",
+        lambda: {lang: (pool or scheduler).queue_depth(lang) for lang in LANGUAGES}, label="language",
+    )
+    metrics_sink.add_gauge(
+        "cache_hit_ratio", "Hit ratio of the feature and audio caches",
+        lambda: {name: cache.stats()["hit_ratio"]
+                 for name, cache in [("feature", feature_cache), ("audio", audio_cache)] if cache is not None},
+        label="cache",
+    )
+    metrics_sink.add_gauge("loaded_models", "Number of loaded TTS models", lambda: len(models.loaded()))
+    metrics_sink.add_gauge("loaded_model_bytes", "Estimated size of the loaded model weights", models.memory_bytes)
+    metrics.set_sink(metrics_sink)
 
 # ─── Gradio UI Callbacks ────────────────────────────────────────────────────────
 def synthesize(speaker: str, text: str, speed: float, language: str,  sdp_ratio: float = 0.2, noise_scale: float = 0.6, noise_scale_w: float = 0.8, progress=gr.Progress()):
@@ -52,17 +168,24 @@ def synthesize(speaker: str, text: str, speed: float, language: str,  sdp_ratio:
         except KeyError:
             logger.error(f"Invalid speaker: {speaker} for language {language}")
             return None
-        model.tts_to_file(
-            text,
-            spk_id,
-            bio,
-            speed=speed,
-            sdp_ratio=sdp_ratio,
-            noise_scale=noise_scale,
-            noise_scale_w=noise_scale_w,
-            pbar=progress.tqdm,
-            format="wav"
-        )
+        if pool is not None:
+            audio = pool.synthesize(
+                language, text, spk_id,
+                speed=speed, sdp_ratio=sdp_ratio, noise_scale=noise_scale, noise_scale_w=noise_scale_w,
+            )
+            soundfile.write(bio, audio, model.hps.data.sampling_rate, format="wav")
+        else:
+            model.tts_to_file(
+                text,
+                spk_id,
+                bio,
+                speed=speed,
+                sdp_ratio=sdp_ratio,
+                noise_scale=noise_scale,
+                noise_scale_w=noise_scale_w,
+                pbar=progress.tqdm,
+                format="wav"
+            )
         logger.info(f"Synthesized audio for language={language}, speaker={speaker}")
         return bio.getvalue()
     except Exception as e:
@@ -74,12 +197,11 @@ def load_speakers(language: str, text: str):
     """
     Update speakers dropdown and default text when language changes.
     """
-    model = models.get(language)
-    if not model:
+    if language not in models:
         logger.error(f"No model loaded for language: {language}")
         return gr.update(choices=[], value=None), text
-    # HParams.data.spk2id is an HParams mapping, use keys()
-    speakers = list(model.hps.data.spk2id.keys())
+    # HParams.data.spk2id is an HParams mapping, use keys(); the config is enough here
+    speakers = list(models.get_hps(language).data.spk2id.keys())
     defaults = {
         "EN": "The field of text-to-speech has seen rapid development recently.",
         "ES": "El campo de síntesis de voz ha experimentado un rápido desarrollo recientemente.",
@@ -136,6 +258,7 @@ logger.info("TTS OpenAPI docs available at /tts/docs and OpenAPI spec at /tts/op
 # Handle Pydantic validation errors to return detailed messages
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 
 @tts_app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request, exc):
@@ -153,9 +276,19 @@ class TextModel(BaseModel):
     sdp_ratio: float = 0.2
     noise_scale: float = 0.6
     noise_scale_w: float = 0.8
+    seed: Optional[int] = None  # makes sampling reproducible, sentence i uses seed + i
+    bert: Optional[str] = None  # BERT provider, e.g. "zeros" for a faster frontend; default of the model if unset
+
+class StreamTextModel(TextModel):
+    format: str = "wav"  # "wav" (PCM16 with streaming header) or "pcm" (raw PCM16)
 
 def get_model(body: TextModel) -> TTS:
-    model = models.get(body.language)
+    # sync dependency, so a first-request model load runs in the threadpool
+    try:
+        model = models.get(body.language)
+    except Exception as e:
+        logger.error(f"Failed to load model for {body.language}: {e}")
+        model = None
     if not model:
         logger.error(f"Requested model not available: {body.language}")
     return model
@@ -170,8 +303,36 @@ async def ping():
         "build_id": BUILD_ID
     }
 
+@tts_app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrics of the synthesis pipeline."""
+    if metrics_sink is None:
+        return JSONResponse(status_code=404, content={"error": "Metrics are disabled"})
+    data, content_type = metrics_sink.generate()
+    return Response(content=data, media_type=content_type)
+
+@tts_app.get("/health/live")
+async def health_live():
+    """Liveness: the server process answers."""
+    return {"status": "alive"}
+
+@tts_app.get("/health/ready")
+async def health_ready():
+    """
+    Readiness: the preloaded models (or the worker processes) have loaded and run a
+    warm-up synthesis, so the first requests do not pay for lazy initialization.
+    Not ready while a preloaded model failed to load; "failed" lists the errors.
+    """
+    failed = models.failed()
+    ready = (pool.is_ready() if pool is not None else models.is_ready()) and not failed
+    content = {"ready": ready, "loaded": models.loaded(), "failed": failed}
+    if not ready:
+        return JSONResponse(status_code=503, content=content)
+    return content
+
 @tts_app.post("/convert/tts")
 async def convert_tts(
+        request: Request,
         body: TextModel = Body(...),
         model: TTS = Depends(get_model)
 ):
@@ -185,31 +346,138 @@ async def convert_tts(
     except KeyError:
         logger.warning(f"Invalid speaker_id: {body.speaker_id}")
         return JSONResponse(status_code=400, content={"error": f"Invalid speaker_id '{body.speaker_id}'"})
+    if body.bert is not None and body.bert not in BERT_PROVIDERS:
+        return JSONResponse(status_code=400, content={"error": f"Invalid bert '{body.bert}'"})
+
+    # Deterministic requests are cached and get an ETag derived from the cache key
+    headers = {"Content-Disposition": f"attachment; filename=tts_{body.language}.wav"}
+    cache_key = None
+    if model.is_deterministic(body.sdp_ratio, body.noise_scale, body.noise_scale_w, body.seed):
+        cache_key = model.audio_cache_key(
+            body.text, spk_id, body.speed, body.sdp_ratio, body.noise_scale, body.noise_scale_w,
+            seed=body.seed, gap=0.05, crossfade=None, bert=body.bert or model.bert_provider,
+        )
+        etag = f'"{cache_key}"'
+        headers["ETag"] = etag
+        if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+            logger.info(f"Audio not modified for language={body.language}, speaker={body.speaker_id}")
+            return Response(status_code=304, headers={"ETag": etag})
 
     # Use in-memory buffer
     bio = io.BytesIO()
     try:
-        model.tts_to_file(
-            body.text,
-            spk_id,
-            bio,
-            speed=body.speed,
-            sdp_ratio=body.sdp_ratio,
-            noise_scale=body.noise_scale,
-            noise_scale_w=body.noise_scale_w,
-            format="wav"
-        )
+        audio = audio_cache.get(cache_key) if audio_cache is not None and cache_key else None
+        if audio is None:
+            # the frontend runs in the threadpool, the acoustic model in the scheduler's batches
+            audio = await run_in_threadpool(
+                synthesize_audio,
+                body.language,
+                body.text,
+                spk_id,
+                speed=body.speed,
+                sdp_ratio=body.sdp_ratio,
+                noise_scale=body.noise_scale,
+                noise_scale_w=body.noise_scale_w,
+                seed=body.seed,
+                bert_provider=body.bert,
+            )
+            if audio_cache is not None and cache_key:
+                audio_cache.put(cache_key, audio)
+        with metrics.timed("audio_encoding", body.language):
+            soundfile.write(bio, audio, model.hps.data.sampling_rate, format="wav")
         bio.seek(0)
         logger.info(f"Streamed TTS audio for language={body.language}, speaker={body.speaker_id}")
         return StreamingResponse(
             bio,
             media_type="audio/wav",
-            headers={"Content-Disposition": f"attachment; filename=tts_{body.language}.wav"}
+            headers=headers
         )
     except Exception as e:
         logger.error(f"Error during TTS generation: {e}")
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+def wav_stream_header(sample_rate: int, channels: int = 1, bits: int = 16) -> bytes:
+    """
+    WAV header for a stream of unknown length; the RIFF/data sizes are set to the
+    maximum, which players treat as "read until end of stream".
+    """
+    block_align = channels * bits // 8
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 0xFFFFFFFF, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, bits,
+        b"data", 0xFFFFFFFF,
+    )
+
+def to_pcm16(audio: np.ndarray) -> bytes:
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+@tts_app.post("/convert/tts/stream")
+async def convert_tts_stream(
+        body: StreamTextModel = Body(...),
+        model: TTS = Depends(get_model)
+):
+    """
+    Convert text to speech and stream it sentence by sentence as chunked PCM16,
+    so the first audio arrives after one sentence instead of the whole text.
+    """
+    logger.info(f"/tts/convert/tts/stream request: {body}")
+    try:
+        spk_id = model.hps.data.spk2id[body.speaker_id]
+    except KeyError:
+        logger.warning(f"Invalid speaker_id: {body.speaker_id}")
+        return JSONResponse(status_code=400, content={"error": f"Invalid speaker_id '{body.speaker_id}'"})
+    if body.format not in ("wav", "pcm"):
+        return JSONResponse(status_code=400, content={"error": f"Invalid format '{body.format}'"})
+    if body.bert is not None and body.bert not in BERT_PROVIDERS:
+        return JSONResponse(status_code=400, content={"error": f"Invalid bert '{body.bert}'"})
+
+    sr = model.hps.data.sampling_rate
+    texts = model.split_sentences_into_pieces(body.text, model.language, quiet=True)
+    # same inter-sentence gap as TTS.audio_numpy_concat
+    gap = to_pcm16(np.zeros(int((sr * 0.05) / body.speed), dtype=np.float32))
+
+    async def audio_stream():
+        if body.format == "wav":
+            yield wav_stream_header(sr)
+        for t, sentence_seed in zip(texts, model.sentence_seeds(body.seed, len(texts))):
+            try:
+                if pool is not None:
+                    # one job per sentence, the gap is added below
+                    audio = await asyncio.wrap_future(pool.submit(
+                        body.language, "tts_to_file", t, spk_id, None,
+                        speed=body.speed,
+                        sdp_ratio=body.sdp_ratio,
+                        noise_scale=body.noise_scale,
+                        noise_scale_w=body.noise_scale_w,
+                        seed=sentence_seed,
+                        quiet=True,
+                        gap=0,
+                        bert_provider=body.bert,
+                    ))
+                else:
+                    features = await run_in_threadpool(model.text_to_features, t, body.bert)
+                    audio = await asyncio.wrap_future(scheduler.submit(
+                        body.language,
+                        features,
+                        spk_id,
+                        speed=body.speed,
+                        sdp_ratio=body.sdp_ratio,
+                        noise_scale=body.noise_scale,
+                        noise_scale_w=body.noise_scale_w,
+                        seed=sentence_seed,
+                        model=model,
+                    ))
+            except Exception as e:
+                # headers are already sent, all we can do is end the stream early
+                logger.error(f"Error during streaming TTS generation: {e}")
+                return
+            yield to_pcm16(audio) + gap
+        logger.info(f"Streamed {len(texts)} sentences for language={body.language}, speaker={body.speaker_id}")
+
+    media_type = "audio/wav" if body.format == "wav" else f"audio/L16; rate={sr}; channels=1"
+    return StreamingResponse(audio_stream(), media_type=media_type)
+
 # ─── Additional TTS API Endpoints ─────────────────────────────────────────────
 @tts_app.get("/languages")
 async def list_languages():
@@ -221,12 +489,12 @@ async def list_languages():
 async def list_speakers(language: str):
     """Return available speakers for a given language query parameter."""
     logger.info(f"/tts/speakers request received for language={language}")
-    model = models.get(language)
-    if not model:
+    if language not in models:
         logger.warning(f"Requested speakers for unknown language: {language}")
         from fastapi import HTTPException
         raise HTTPException(status_code=404, detail="Language not found")
-    return {"speakers": list(model.hps.data.spk2id.keys())}
+    hps = await run_in_threadpool(models.get_hps, language)
+    return {"speakers": list(hps.data.spk2id.keys())}
 
 # ─── Mount TTS API on Gradio App ─────────────────────────────────────────────────
 gr_app.mount("/tts", tts_app)
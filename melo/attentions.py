@@ -1,4 +1,3 @@
-import math
 import torch
 from torch import nn
 from torch.nn import functional as F
@@ -100,8 +99,7 @@ class Encoder(nn.Module):
         x = x * x_mask
         for i in range(self.n_layers):
             if i == self.cond_layer_idx and g is not None:
-                g = self.spk_emb_linear(g.transpose(1, 2))
-                g = g.transpose(1, 2)
+                g = commons.speaker_projection(self.spk_emb_linear, g)
                 x = x + g
                 x = x * x_mask
             y = self.attn_layers[i](x, x, attn_mask)
@@ -229,6 +227,8 @@ class MultiHeadAttention(nn.Module):
         self.attn = None
 
         self.k_channels = channels // n_heads
+        # 1 / sqrt(d_k), 1 once folded into conv_q by `fold_query_scale`
+        self.query_scale = self.k_channels**-0.5
         self.conv_q = nn.Conv1d(channels, channels, 1)
         self.conv_k = nn.Conv1d(channels, channels, 1)
         self.conv_v = nn.Conv1d(channels, channels, 1)
@@ -265,6 +265,12 @@ class MultiHeadAttention(nn.Module):
         x = self.conv_o(x)
         return x
 
+    @torch.no_grad()
+    def fold_query_scale(self):
+        self.conv_q.weight.mul_(self.query_scale)
+        self.conv_q.bias.mul_(self.query_scale)
+        self.query_scale = 1.0
+
     def attention(self, query, key, value, mask=None):
         # reshape [b, d, t] -> [b, n_h, t, d_k]
         b, d, t_s, t_t = (*key.size(), query.size(2))
@@ -272,15 +278,15 @@ class MultiHeadAttention(nn.Module):
         key = key.view(b, self.n_heads, self.k_channels, t_s).transpose(2, 3)
         value = value.view(b, self.n_heads, self.k_channels, t_s).transpose(2, 3)
 
-        scores = torch.matmul(query / math.sqrt(self.k_channels), key.transpose(-2, -1))
+        if self.query_scale != 1:
+            query = query * self.query_scale
+        scores = torch.matmul(query, key.transpose(-2, -1))
         if self.window_size is not None:
             assert (
                 t_s == t_t
             ), "Relative attention is only available for self-attention."
             key_relative_embeddings = self._get_relative_embeddings(self.emb_rel_k, t_s)
-            rel_logits = self._matmul_with_relative_keys(
-                query / math.sqrt(self.k_channels), key_relative_embeddings
-            )
+            rel_logits = self._matmul_with_relative_keys(query, key_relative_embeddings)
             scores_local = self._relative_position_to_absolute_position(rel_logits)
             scores = scores + scores_local
         if self.proximal_bias:
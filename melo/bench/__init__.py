@@ -0,0 +1,2 @@
+from .corpus import corpus, LENGTHS
+from .runner import run, load_tts, bench_latency, bench_concurrency
@@ -0,0 +1,116 @@
+import json
+
+import click
+import torch
+
+from melo.compiled import BACKENDS
+from melo.quantize import QUANTIZE_MODES
+from .corpus import corpus, LENGTHS, SENTENCES
+
+LANGUAGES = ['EN', 'ES', 'FR', 'ZH', 'JP', 'KR']
+
+
+def _split(ctx, param, value):
+    if not value:
+        return []
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+@click.group()
+def main():
+    """Benchmarks of the synthesis pipeline."""
+
+
+@main.command()
+@click.option('--language', '-l', 'languages', default='EN', callback=_split, help='Comma separated languages, e.g. EN,ZH')
+@click.option('--lengths', default=','.join(LENGTHS), callback=_split, help='Comma separated text lengths')
+@click.option('--texts', '-n', default=5, show_default=True, help='Texts per length')
+@click.option('--repeats', '-r', default=1, show_default=True, help='Times every text is synthesized')
+@click.option('--clients', '-c', default='1', callback=_split, help='Comma separated numbers of concurrent clients, e.g. 1,4')
+@click.option('--warmup', default=1, show_default=True, help='Warm-up synthesis calls before measuring')
+@click.option('--batch-size', default=1, show_default=True, help='Sentences per forward pass, see TTS.tts_to_file')
+@click.option('--random', 'random_init', is_flag=True, default=False, help='Randomly initialized weights, no checkpoint needed')
+@click.option('--ckpt', 'ckpt_path', default=None, help='Local checkpoint instead of the released one')
+@click.option('--config', 'config_path', default=None, help='Local config.json')
+@click.option('--bert/--no-bert', default=None, help='Compute BERT features (default: on, off with --random)')
+@click.option('--backend', default='eager', show_default=True, type=click.Choice(BACKENDS), help='Acoustic model backend, see TTS')
+@click.option('--quantize', default=None, type=click.Choice(QUANTIZE_MODES), help='Quantized models, see TTS')
+@click.option('--onnx', 'onnx_dir', default=None, help='Run the graphs of melo.export_onnx in this directory with onnxruntime')
+@click.option('--device', '-d', default='cpu', show_default=True)
+@click.option('--threads', default=None, type=int, help='torch.set_num_threads')
+@click.option('--seed', default=0, show_default=True, help='Seed of the corpus, the random weights and the synthesis')
+@click.option('--output', '-o', default=None, help='Write the JSON results to this file instead of stdout')
+def run(languages, lengths, texts, repeats, clients, warmup, batch_size, random_init, ckpt_path, config_path, bert,
+        backend, quantize, onnx_dir, device, threads, seed, output):
+    """Measure latency, realtime factor, per-stage cost, concurrency and peak RSS."""
+    from .runner import run as run_benchmark
+
+    languages = [language.upper() for language in languages]
+    for language in languages:
+        if language not in SENTENCES:
+            raise click.BadParameter(f"'{language}' is not one of {LANGUAGES}", param_hint='--language')
+    for length in lengths:
+        if length not in LENGTHS:
+            raise click.BadParameter(f"'{length}' is not one of {list(LENGTHS)}", param_hint='--lengths')
+    if threads:
+        torch.set_num_threads(threads)
+    if bert is None:
+        bert = not random_init
+    results = run_benchmark(
+        languages, lengths, texts_per_length=texts, repeats=repeats, clients=[int(c) for c in clients],
+        device=device, ckpt_path=ckpt_path, config_path=config_path, random_init=random_init, bert=bert,
+        seed=seed, warmup=warmup, batch_size=batch_size, backend=backend, onnx_dir=onnx_dir,
+        quantize=quantize, log=lambda message: click.echo(message, err=True),
+    )
+    _write(results, output)
+
+
+def _write(results, output):
+    text = json.dumps(results, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        click.echo(text)
+
+
+@main.command()
+@click.option('--language', '-l', 'languages', default='EN', callback=_split, help='Comma separated languages, e.g. EN,ZH')
+@click.option('--quantize', default='int8', show_default=True, type=click.Choice(QUANTIZE_MODES))
+@click.option('--length', default='medium', show_default=True, type=click.Choice(list(LENGTHS)))
+@click.option('--texts', '-n', default=5, show_default=True, help='Texts to compare')
+@click.option('--random', 'random_init', is_flag=True, default=False, help='Randomly initialized weights, no checkpoint needed')
+@click.option('--ckpt', 'ckpt_path', default=None, help='Local checkpoint instead of the released one')
+@click.option('--config', 'config_path', default=None, help='Local config.json')
+@click.option('--bert/--no-bert', default=None, help='Compute BERT features (default: on, off with --random)')
+@click.option('--threads', default=None, type=int, help='torch.set_num_threads')
+@click.option('--seed', default=0, show_default=True)
+@click.option('--output', '-o', default=None, help='Write the JSON results to this file instead of stdout')
+def quality(languages, quantize, length, texts, random_init, ckpt_path, config_path, bert, threads, seed, output):
+    """Compare quantized to float32 output: log-mel distance, weight size, realtime factor."""
+    from .runner import run_quality
+
+    languages = [language.upper() for language in languages]
+    for language in languages:
+        if language not in SENTENCES:
+            raise click.BadParameter(f"'{language}' is not one of {LANGUAGES}", param_hint='--language')
+    if threads:
+        torch.set_num_threads(threads)
+    if bert is None:
+        bert = not random_init
+    results = run_quality(
+        languages, quantize, length=length, texts_per_length=texts, ckpt_path=ckpt_path, config_path=config_path,
+        random_init=random_init, bert=bert, seed=seed, log=lambda message: click.echo(message, err=True),
+    )
+    _write(results, output)
+
+
+@main.command('corpus')
+@click.option('--language', '-l', default='EN', type=click.Choice(LANGUAGES, case_sensitive=False))
+@click.option('--length', default='short', type=click.Choice(list(LENGTHS)))
+@click.option('--texts', '-n', default=5, show_default=True)
+@click.option('--seed', default=0, show_default=True)
+def show_corpus(language, length, texts, seed):
+    """Print the benchmark texts."""
+    for text in corpus(language.upper(), length, texts, seed=seed):
+        click.echo(text)
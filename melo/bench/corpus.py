@@ -0,0 +1,116 @@
+import random
+
+# plain, everyday sentences without digits or abbreviations, so that every
+# language runs through the same frontend steps
+SENTENCES = {
+    'EN': [
+        "The quick brown fox jumps over the lazy dog.",
+        "Please call me back when you get this message.",
+        "The weather will be sunny in the morning and cloudy in the afternoon.",
+        "She opened the window and listened to the birds singing outside.",
+        "Our train leaves at noon, so we should hurry to the station.",
+        "Reading a good book on a rainy day is one of life's simple pleasures.",
+        "The museum is closed on Mondays, but it opens early on weekends.",
+        "He could not believe how much the city had changed over the years.",
+        "Turn left at the next corner and walk straight until you see the bridge.",
+        "Thank you for your patience while we fix the problem.",
+        "Fresh bread from the bakery smells wonderful in the early morning.",
+        "The children laughed as the little dog chased its own tail.",
+    ],
+    'ES': [
+        "El perro corre rápidamente por el parque.",
+        "Por favor, llámame cuando recibas este mensaje.",
+        "Mañana hará sol por la mañana y estará nublado por la tarde.",
+        "Ella abrió la ventana y escuchó a los pájaros cantar.",
+        "Nuestro tren sale al mediodía, así que debemos darnos prisa.",
+        "Leer un buen libro en un día de lluvia es un placer sencillo.",
+        "El museo está cerrado los lunes, pero abre temprano los fines de semana.",
+        "No podía creer cuánto había cambiado la ciudad con los años.",
+        "Gira a la izquierda en la próxima esquina y sigue recto hasta el puente.",
+        "Gracias por su paciencia mientras solucionamos el problema.",
+        "El pan recién hecho huele de maravilla por la mañana.",
+        "Los niños se rieron cuando el perrito persiguió su propia cola.",
+    ],
+    'FR': [
+        "Le chien court rapidement dans le parc.",
+        "Merci de me rappeler quand tu recevras ce message.",
+        "Demain, il fera beau le matin et nuageux l'après-midi.",
+        "Elle a ouvert la fenêtre et a écouté les oiseaux chanter.",
+        "Notre train part à midi, nous devons donc nous dépêcher.",
+        "Lire un bon livre un jour de pluie est un plaisir simple.",
+        "Le musée est fermé le lundi, mais il ouvre tôt le week-end.",
+        "Il ne pouvait pas croire à quel point la ville avait changé.",
+        "Tournez à gauche au prochain coin et continuez jusqu'au pont.",
+        "Merci de votre patience pendant que nous réglons le problème.",
+        "Le pain frais de la boulangerie sent très bon le matin.",
+        "Les enfants ont ri quand le petit chien a poursuivi sa queue.",
+    ],
+    'ZH': [
+        "今天天气很好，我们去公园散步吧。",
+        "请你收到这条消息以后给我回电话。",
+        "明天上午是晴天，下午会转为多云。",
+        "她打开窗户，听着外面的小鸟唱歌。",
+        "我们的火车中午出发，所以要快点去车站。",
+        "下雨天读一本好书是一件很惬意的事情。",
+        "博物馆星期一闭馆，周末开门比较早。",
+        "他不敢相信这座城市这些年变化这么大。",
+        "在下一个路口左转，然后一直走到桥边。",
+        "感谢您的耐心，我们正在解决这个问题。",
+        "清晨面包店里新鲜面包的味道非常好闻。",
+        "小狗追着自己的尾巴转圈，孩子们都笑了。",
+    ],
+    'JP': [
+        "今日はとても良い天気ですね。",
+        "このメッセージを受け取ったら、折り返し電話してください。",
+        "明日は朝から晴れて、午後は曇りになるでしょう。",
+        "彼女は窓を開けて、外で鳴く鳥の声を聞いた。",
+        "電車は昼に出発するので、急いで駅に行きましょう。",
+        "雨の日に良い本を読むのは、ささやかな楽しみです。",
+        "博物館は月曜日が休みですが、週末は早く開きます。",
+        "彼は街がこんなに変わったことが信じられなかった。",
+        "次の角を左に曲がって、橋までまっすぐ歩いてください。",
+        "問題を解決するまで、しばらくお待ちください。",
+        "朝のパン屋さんは、焼きたてのパンの良い香りがします。",
+        "子犬が自分のしっぽを追いかけて、子どもたちが笑った。",
+    ],
+    'KR': [
+        "오늘은 날씨가 정말 좋네요.",
+        "이 메시지를 받으면 다시 전화해 주세요.",
+        "내일 오전에는 맑고 오후에는 구름이 많겠습니다.",
+        "그녀는 창문을 열고 밖에서 우는 새소리를 들었다.",
+        "기차가 정오에 출발하니까 서둘러 역으로 가야 해요.",
+        "비 오는 날 좋은 책을 읽는 것은 소소한 즐거움입니다.",
+        "박물관은 월요일에 쉬지만 주말에는 일찍 문을 엽니다.",
+        "그는 도시가 이렇게 많이 변했다는 것을 믿을 수 없었다.",
+        "다음 모퉁이에서 왼쪽으로 돌아 다리까지 쭉 걸어가세요.",
+        "문제를 해결하는 동안 기다려 주셔서 감사합니다.",
+        "아침 빵집에서는 갓 구운 빵 냄새가 아주 좋습니다.",
+        "강아지가 자기 꼬리를 쫓아다니자 아이들이 웃었다.",
+    ],
+}
+SENTENCES['SP'] = SENTENCES['ES']
+SENTENCES['ZH_MIX_EN'] = SENTENCES['ZH']
+
+# number of sentences per text
+LENGTHS = {
+    'short': 1,
+    'medium': 3,
+    'long': 10,
+}
+
+_SEPARATOR = {'ZH': '', 'ZH_MIX_EN': '', 'JP': ''}
+
+
+def corpus(language, length, n=5, seed=0):
+    """
+    `n` texts of `length` (one of LENGTHS) in `language`. The same arguments give
+    the same texts, so results of different runs compare like for like.
+    """
+    if language not in SENTENCES:
+        raise ValueError(f"No benchmark sentences for language '{language}', expected one of {sorted(SENTENCES)}")
+    if length not in LENGTHS:
+        raise ValueError(f"Unknown text length '{length}', expected one of {list(LENGTHS)}")
+    sentences = SENTENCES[language]
+    rng = random.Random(seed * 1000 + list(LENGTHS).index(length))
+    separator = _SEPARATOR.get(language, ' ')
+    return [separator.join(rng.sample(sentences, LENGTHS[length])) for _ in range(n)]
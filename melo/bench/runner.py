@@ -0,0 +1,304 @@
+import io
+import os
+import sys
+import time
+import platform
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+from melo import metrics
+from melo.api import TTS
+from melo.profiler import peak_rss_bytes, reset_peak_rss, peak_rss_since_reset
+from melo.mel_processing import mel_spectrogram_torch
+from .corpus import corpus
+
+# pipeline components and the `metrics.timed` stages they are made of
+COMPONENTS = {
+    'g2p': ('text_normalization', 'g2p'),
+    'bert': ('bert',),
+    'acoustic_model': ('enc_p', 'duration', 'flow'),
+    'vocoder': ('decoder',),
+}
+
+
+class StageRecorder:
+    """
+    `metrics` sink keeping every stage timing in memory.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    def timing(self, stage, language, seconds):
+        with self._lock:
+            self.timings.setdefault(stage, []).append(seconds)
+
+    def value(self, name, language, value):
+        pass
+
+    def summary(self):
+        with self._lock:
+            timings = {stage: list(values) for stage, values in self.timings.items()}
+        stages = {
+            stage: {"calls": len(values), "total_s": float(sum(values)), "mean_s": float(np.mean(values))}
+            for stage, values in timings.items()
+        }
+        components = {
+            name: float(sum(sum(timings.get(stage, ())) for stage in members))
+            for name, members in COMPONENTS.items()
+        }
+        return {"stages": stages, "components_s": components}
+
+
+def percentiles(values):
+    values = np.asarray(values, dtype=np.float64)
+    if values.size == 0:
+        return {}
+    return {
+        "mean": float(values.mean()),
+        "min": float(values.min()),
+        "p50": float(np.percentile(values, 50)),
+        "p90": float(np.percentile(values, 90)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+    }
+
+
+def load_tts(language, device='cpu', ckpt_path=None, config_path=None, random_init=False, bert=True, seed=0,
+             backend='eager', onnx_dir=None, quantize=None):
+    """
+    `TTS` to benchmark: the released (or a local) checkpoint, or with `random_init`
+    untrained weights that need neither a download nor a checkpoint, see
+    `TTS.from_config`. Without `bert` the BERT features are stubbed with zeros.
+    `backend` and `quantize` are the ones of `TTS`. With `onnx_dir`, the graphs of
+    `melo.export_onnx` in that directory run in onnxruntime instead, see `OnnxTTS`.
+    """
+    if onnx_dir:
+        from melo.onnx_engine import OnnxTTS
+
+        tts = OnnxTTS(language, onnx_dir, num_threads=torch.get_num_threads())
+        if not bert:
+            tts.bert_provider = 'zeros'
+        return tts
+    if random_init:
+        return TTS.from_config(language, config_path, device=device, seed=seed, bert_provider='bert' if bert else 'zeros',
+                               backend=backend, quantize=quantize)
+    tts = TTS(language, device=device, config_path=config_path, ckpt_path=ckpt_path, backend=backend,
+              quantize=quantize)
+    if not bert:
+        tts.bert_provider = 'zeros'
+    return tts
+
+
+def _speaker_id(tts):
+    return next(iter(tts.hps.data.spk2id.values()), 0)
+
+
+def _synthesize(tts, text, seed, **kwargs):
+    start = time.perf_counter()
+    audio = tts.tts_to_file(text, _speaker_id(tts), None, quiet=True, seed=seed, **kwargs)
+    return time.perf_counter() - start, len(audio) / tts.hps.data.sampling_rate
+
+
+def bench_latency(tts, texts, repeats=1, seed=0, **kwargs):
+    """
+    Synthesize `texts` one after the other, `repeats` times. Returns latency
+    percentiles, realtime factor and the time spent in every pipeline stage.
+    """
+    recorder = StageRecorder()
+    latencies, audio_s = [], []
+    metrics.set_sink(recorder)
+    try:
+        for _ in range(repeats):
+            for i, text in enumerate(texts):
+                latency, duration = _synthesize(tts, text, seed + i, **kwargs)
+                latencies.append(latency)
+                audio_s.append(duration)
+    finally:
+        metrics.set_sink(None)
+    return dict(
+        requests=len(latencies),
+        audio_s=float(sum(audio_s)),
+        wall_s=float(sum(latencies)),
+        # seconds of audio per second of wall time, as the realtime_factor metric
+        realtime_factor=float(sum(audio_s) / sum(latencies)),
+        latency_s=percentiles(latencies),
+        **recorder.summary(),
+    )
+
+
+def bench_concurrency(tts, texts, clients, requests=None, seed=0, **kwargs):
+    """
+    `clients` threads sharing `tts` send `requests` requests in total (by default
+    every text once per client), each waiting for its answer before the next one.
+    """
+    requests = requests or len(texts) * clients
+    jobs = [(texts[i % len(texts)], seed + i % len(texts)) for i in range(requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(lambda job: _synthesize(tts, job[0], job[1], **kwargs), jobs))
+    wall = time.perf_counter() - start
+    latencies = [latency for latency, _ in results]
+    audio_s = sum(duration for _, duration in results)
+    return dict(
+        clients=clients,
+        requests=requests,
+        wall_s=wall,
+        requests_per_s=requests / wall,
+        # seconds of audio produced per second of wall time over all clients
+        throughput=audio_s / wall,
+        latency_s=percentiles(latencies),
+    )
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(device):
+    return dict(
+        git_commit=_git_commit(),
+        python=sys.version.split()[0],
+        torch=torch.__version__,
+        platform=platform.platform(),
+        processor=platform.processor(),
+        cpu_count=os.cpu_count(),
+        num_threads=torch.get_num_threads(),
+        device=str(device),
+    )
+
+
+def run(languages, lengths, texts_per_length=5, repeats=1, clients=(1,), device='cpu', ckpt_path=None,
+        config_path=None, random_init=False, bert=True, seed=0, warmup=1, batch_size=1, backend='eager', onnx_dir=None,
+        quantize=None, log=None):
+    """
+    Full benchmark: for every language, load the model, warm it up, measure every
+    text length sequentially and under every number of concurrent `clients`.
+    Returns a JSON-serializable dict.
+    """
+    log = log or (lambda message: None)
+    settings = dict(
+        languages=list(languages), lengths=list(lengths), texts_per_length=texts_per_length, repeats=repeats,
+        clients=list(clients), random_init=random_init, bert=bert, seed=seed, warmup=warmup, batch_size=batch_size,
+        ckpt_path=ckpt_path, config_path=config_path, backend=backend, onnx_dir=onnx_dir,
+        quantize=quantize,
+    )
+    results = dict(settings=settings, environment=environment(device), languages={})
+    for language in languages:
+        log(f"Loading {language} model")
+        # the peak RSS of each language is measured from before its model is loaded
+        rss_reset = reset_peak_rss()
+        start = time.perf_counter()
+        tts = load_tts(language, device, ckpt_path, config_path, random_init=random_init, bert=bert, seed=seed,
+                       backend=backend, onnx_dir=onnx_dir, quantize=quantize)
+        tts.load_frontend()
+        load_s = time.perf_counter() - start
+        warmup_s = [tts.warmup() for _ in range(warmup)]
+        result = dict(load_s=load_s, warmup_s=warmup_s, lengths={})
+        for length in lengths:
+            texts = corpus(language, length, texts_per_length, seed=seed)
+            log(f"{language}/{length}: sequential")
+            entry = bench_latency(tts, texts, repeats=repeats, seed=seed, batch_size=batch_size)
+            entry["concurrency"] = []
+            for n in clients:
+                if n <= 1:
+                    continue
+                log(f"{language}/{length}: {n} concurrent clients")
+                entry["concurrency"].append(
+                    bench_concurrency(tts, texts, n, requests=len(texts) * n * repeats, seed=seed, batch_size=batch_size)
+                )
+            result["lengths"][length] = entry
+        # None where the high-water mark cannot be reset (outside Linux)
+        result["peak_rss_bytes"] = peak_rss_since_reset() if rss_reset else None
+        results["languages"][language] = result
+        tts.unload_frontend()
+        del tts
+    results["peak_rss_bytes"] = peak_rss_bytes()
+    return results
+
+
+def weights_nbytes(model):
+    # serialized size, which counts the packed int8 weights of quantized layers
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def log_mel(tts, audio):
+    data = tts.hps.data
+    y = torch.from_numpy(np.asarray(audio, dtype=np.float32)).unsqueeze(0)
+    mel = mel_spectrogram_torch(
+        y, data.filter_length, data.n_mel_channels, data.sampling_rate, data.hop_length, data.win_length,
+        data.mel_fmin, data.mel_fmax,
+    )
+    return mel[0].numpy()
+
+
+def mel_distance(reference, candidate):
+    """
+    Mean absolute difference of two log-mel spectrograms [n_mels, frames] along their
+    DTW alignment, so that slightly different durations do not count as spectral error.
+    """
+    import librosa
+
+    cost, path = librosa.sequence.dtw(reference, candidate, metric='cityblock')
+    return float(cost[-1, -1] / len(path) / reference.shape[0])
+
+
+def compare_quality(reference, candidate, texts, seed=0):
+    """
+    Synthesize `texts` with both models and the same seeds. Returns the percentiles
+    of the log-mel distance of `candidate` to `reference` and of their length ratio.
+    """
+    distances, length_ratios = [], []
+    for i, text in enumerate(texts):
+        a = reference.tts_to_file(text, _speaker_id(reference), None, quiet=True, seed=seed + i)
+        b = candidate.tts_to_file(text, _speaker_id(candidate), None, quiet=True, seed=seed + i)
+        distances.append(mel_distance(log_mel(reference, a), log_mel(reference, b)))
+        length_ratios.append(len(b) / len(a))
+    return dict(mel_distance=percentiles(distances), length_ratio=percentiles(length_ratios))
+
+
+def run_quality(languages, quantize, length='medium', texts_per_length=5, device='cpu', ckpt_path=None,
+                config_path=None, random_init=False, bert=True, seed=0, log=None):
+    """
+    Quality check of a quantized model: for every language, the log-mel distance of
+    its output to the float32 output on the benchmark corpus, the size of both weights
+    and the realtime factor of both. Dynamic quantization measures the activation
+    ranges on every call, so the models need no calibration data.
+    """
+    log = log or (lambda message: None)
+    settings = dict(
+        languages=list(languages), quantize=quantize, length=length, texts_per_length=texts_per_length,
+        random_init=random_init, bert=bert, seed=seed, ckpt_path=ckpt_path, config_path=config_path,
+    )
+    results = dict(settings=settings, environment=environment(device), languages={})
+    for language in languages:
+        log(f"Loading {language} models")
+        models = {
+            name: load_tts(language, device, ckpt_path, config_path, random_init=random_init, bert=bert, seed=seed,
+                           quantize=mode)
+            for name, mode in (('float32', None), (quantize, quantize))
+        }
+        texts = corpus(language, length, texts_per_length, seed=seed)
+        log(f"{language}: comparing {quantize} to float32")
+        result = compare_quality(models['float32'], models[quantize], texts, seed=seed)
+        for name, tts in models.items():
+            tts.warmup()
+            latency = bench_latency(tts, texts, seed=seed)
+            result[name] = dict(weights_bytes=weights_nbytes(tts.model), realtime_factor=latency['realtime_factor'])
+            tts.unload_frontend()
+        results["languages"][language] = result
+    return results
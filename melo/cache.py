@@ -0,0 +1,293 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key_hash(key):
+    """
+    Stable hex digest of a (nested) tuple of plain values, used for file names.
+    """
+    return hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU mapping, bounded by number of items and/or total size
+    as measured by `sizeof(value)`.
+    """
+
+    def __init__(self, max_items=None, max_bytes=None, sizeof=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._data[key] = (value, size)
+            self.size += size
+            while self._data and (
+                (self.max_items is not None and len(self._data) > self.max_items)
+                or (self.max_bytes is not None and self.size > self.max_bytes)
+            ):
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.size -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "items": len(self._data), "bytes": self.size}
+
+
+class DiskCache:
+    """
+    Directory backed cache with one file per key. When `max_bytes` is set, the least
+    recently used files are removed. The directory is scanned once at startup (by
+    modification time, refreshed on every hit); after that the sizes and the LRU order
+    are tracked in memory, so files written by other processes are only counted after
+    a restart.
+    """
+
+    def __init__(self, cache_dir, max_bytes=None, suffix=".pt", save=None, load=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.save = save or torch.save
+        self.load = load or (lambda path: torch.load(path, map_location="cpu"))
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._index = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        for _, size, name in sorted(self._entries()):
+            self._index[name] = size
+            self.size += size
+        if max_bytes is not None:
+            self._remove(self._evict())
+
+    def _name(self, key):
+        return cache_key_hash(key) + self.suffix
+
+    def get(self, key):
+        name = self._name(key)
+        path = os.path.join(self.cache_dir, name)
+        try:
+            value = self.load(path)
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            self._forget(name)
+            return None
+        except Exception as e:
+            logger.warning(f"Dropping unreadable cache file {path}: {e}")
+            self.misses += 1
+            self._forget(name)
+            self._remove([name])
+            return None
+        with self._lock:
+            if name in self._index:
+                self._index.move_to_end(name)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        name = self._name(key)
+        path = os.path.join(self.cache_dir, name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            self.save(value, f)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.size += size - self._index.pop(name, 0)
+            self._index[name] = size
+            evicted = self._evict() if self.max_bytes is not None else []
+        self._remove(evicted)
+
+    def _forget(self, name):
+        with self._lock:
+            self.size -= self._index.pop(name, 0)
+
+    def _evict(self):
+        # called with the lock held, returns the names to remove once it is released
+        evicted = []
+        while self._index and self.size > self.max_bytes:
+            name, size = self._index.popitem(last=False)
+            self.size -= size
+            evicted.append(name)
+        return evicted
+
+    def _remove(self, names):
+        for name in names:
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(self.suffix):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        return entries
+
+    def clear(self):
+        with self._lock:
+            self._index.clear()
+            self.size = 0
+        self._remove([name for _, _, name in self._entries()])
+
+    def __len__(self):
+        return len(self._index)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "items": len(self._index), "bytes": self.size}
+
+
+def _tensors_nbytes(tensors):
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class FeatureCache:
+    """
+    Cache of text frontend output, i.e. the (bert, ja_bert, phones, tones, lang_ids)
+    tensors of `utils.get_text_for_tts_infer`, keyed by (language, normalized text,
+    frontend id). Lookups go to a bounded in-memory LRU first and then, if
+    `cache_dir` is set, to disk, where the least recently used files beyond
+    `max_bytes` are removed.
+    """
+
+    def __init__(self, max_items=256, cache_dir=None, max_bytes=1024 * 2**20):
+        self.memory = LRUCache(max_items=max_items, sizeof=_tensors_nbytes)
+        self.disk = DiskCache(cache_dir, max_bytes=max_bytes) if cache_dir else None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        features = self.memory.get(key)
+        if features is None and self.disk is not None:
+            features = self.disk.get(key)
+            if features is not None:
+                self.memory.put(key, features)
+        if features is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return features
+
+    def put(self, key, features):
+        features = tuple(features)
+        self.memory.put(key, features)
+        if self.disk is not None:
+            self.disk.put(key, tuple(t.cpu() for t in features))
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.,
+            "items": len(self.memory),
+            "bytes": self.memory.size,
+        }
+
+
+def _array_nbytes(audio):
+    return audio.nbytes
+
+
+class AudioCache:
+    """
+    Cache of synthesized waveforms of deterministic requests, keyed by
+    `TTS.audio_cache_key`. Backends:
+
+    - "memory": in-memory LRU bounded by `max_items`
+    - "lru":    in-memory LRU bounded by `max_bytes`
+    - "disk":   one .npy file per entry in `cache_dir`, LRU bounded by `max_bytes`
+    """
+
+    def __init__(self, backend="lru", max_items=1024, max_bytes=256 * 2**20, cache_dir=None):
+        if backend == "memory":
+            self.store = LRUCache(max_items=max_items, sizeof=_array_nbytes)
+        elif backend == "lru":
+            self.store = LRUCache(max_bytes=max_bytes, sizeof=_array_nbytes)
+        elif backend == "disk":
+            if not cache_dir:
+                raise ValueError("The disk audio cache needs a cache_dir")
+            self.store = DiskCache(
+                cache_dir, max_bytes=max_bytes, suffix=".npy",
+                save=lambda audio, f: np.save(f, audio), load=np.load,
+            )
+        else:
+            raise ValueError(f"Unknown audio cache backend '{backend}', expected 'memory', 'lru' or 'disk'")
+        self.backend = backend
+
+    def get(self, key):
+        audio = self.store.get(key)
+        # entries in memory are read-only, callers get their own copy
+        if audio is not None and not audio.flags.writeable:
+            audio = audio.copy()
+        return audio
+
+    def put(self, key, audio):
+        # a copy, so that later changes to the caller's array do not reach the cache
+        audio = np.array(audio, dtype=np.float32)
+        audio.setflags(write=False)
+        self.store.put(key, audio)
+
+    def clear(self):
+        self.store.clear()
+
+    def stats(self):
+        stats = self.store.stats()
+        total = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / total if total else 0.
+        return stats
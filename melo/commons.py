@@ -125,6 +125,73 @@ def sequence_mask(length, max_length=None):
     return x.unsqueeze(0) < length.unsqueeze(1)
 
 
+def bucket_length(n, buckets):
+    """
+    Smallest bucket >= n, or n rounded up to a multiple of the last bucket.
+    """
+    for bucket in buckets:
+        if n <= bucket:
+            return bucket
+    return -(-n // buckets[-1]) * buckets[-1]
+
+
+def randn_seeded(shape, lengths=None, generator=None):
+    """
+    Standard normal noise of `shape` [b, c, t], drawn on the CPU so that a seed gives
+    the same noise on every device. `generator` is a single torch.Generator or one
+    per batch item (None entries use the global RNG). With one generator per item,
+    item i only draws noise for its first `lengths[i]` frames and the rest stays zero,
+    so its result does not depend on what it was batched with.
+    """
+    if isinstance(generator, (list, tuple)):
+        out = torch.zeros(shape)
+        for i, g in enumerate(generator):
+            n = int(lengths[i]) if lengths is not None else shape[-1]
+            out[i, :, :n] = torch.randn(shape[1], n, generator=g)
+        return out
+    return torch.randn(shape, generator=generator)
+
+
+class SpeakerCond:
+    """
+    Speaker conditioning `g` [b, gin, 1] of a batch of speaker ids `sid`, passed as
+    `g=` through the model at inference. `speaker_projection` takes the output of a
+    conditioning layer from `cache` (layer -> [n_speakers, out, 1]), which is filled
+    for every speaker of `table` [n_speakers, gin] at the first use of the layer.
+    """
+
+    def __init__(self, g, sid, table, cache):
+        self.g = g
+        self.sid = sid
+        self.table = table
+        self.cache = cache
+
+    def detach(self):
+        return self
+
+    def project(self, layer):
+        out = self.cache.get(layer)
+        if out is None:
+            with torch.no_grad():
+                # all speakers in one call, laid out along the time axis of the layer
+                out = speaker_projection(layer, self.table.t().unsqueeze(0))
+            out = out[0].t().unsqueeze(-1)
+            self.cache[layer] = out
+        return out[self.sid]
+
+
+def speaker_projection(layer, g):
+    """
+    Output of a speaker conditioning layer (a 1x1 Conv1d, or a Linear over the
+    channels) for `g`, a [b, gin, t] tensor or a `SpeakerCond`. Returns [b, out, t].
+    """
+    if isinstance(g, SpeakerCond):
+        return g.project(layer)
+    if isinstance(layer, torch.nn.Linear):
+        return layer(g.transpose(1, 2)).transpose(1, 2)
+    return layer(g)
+
+
 def generate_path(duration, mask):
     """
     duration: [b, 1, t_x]
@@ -0,0 +1,83 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("eager", "compile")
+
+# padded lengths of the phone sequences; each bucket is compiled once (per batch
+# size), longer inputs are rounded up to a multiple of the last bucket
+TEXT_BUCKETS = (32, 64, 96, 128, 192, 256, 384, 512)
+
+# submodules of `SynthesizerTrn` compiled for the bucketed phone lengths, and for
+# any number of latent frames. The frames are not bucketed: the flow and the
+# decoder do most of the work, padding them would cost more than recompiling.
+# The stochastic duration predictor stays eager, it samples with per-sentence generators.
+TEXT_MODULES = ("enc_p", "dp")
+FRAME_MODULES = ("flow", "dec")
+
+# graphs for the phone lengths past the last bucket, compiled on top of one per
+# bucket and batch size
+EXTRA_GRAPHS = 16
+
+
+def default_max_batch_size():
+    # the scheduler's batch size, see melo/app.py
+    return int(os.getenv("TTS_MAX_BATCH_SIZE", "8"))
+
+
+def recompile_limit(max_batch_size=None):
+    """
+    Graphs dynamo may compile per compiled submodule before it falls back to eager:
+    every bucket and batch size is a separate graph of the same code.
+    """
+    max_batch_size = max_batch_size or default_max_batch_size()
+    return len(TEXT_BUCKETS) * max_batch_size + EXTRA_GRAPHS
+
+
+def default_cache_dir():
+    return os.getenv("TTS_COMPILE_CACHE_DIR") or os.path.join(
+        os.path.expanduser("~"), ".cache", "melotts", "inductor"
+    )
+
+
+def set_cache_dir(cache_dir=None):
+    """
+    Keep the kernels and graphs compiled by inductor in `cache_dir`, so that later
+    processes load them instead of compiling again.
+    """
+    cache_dir = cache_dir or default_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ["TORCHINDUCTOR_CACHE_DIR"] = cache_dir
+    import torch._inductor.config as inductor_config
+
+    inductor_config.fx_graph_cache = True
+    return cache_dir
+
+
+def compile_model(model, cache_dir=None, mode=None, max_batch_size=None):
+    """
+    Compile the submodules of a `SynthesizerTrn` in place with `torch.compile`
+    (inductor), which fuses the small convolutions and elementwise ops of the
+    attention and WN layers, the flows and the ResBlocks of the decoder. Callers pad
+    the phones to TEXT_BUCKETS (see `TTS._pad_features`). Compilation happens on the
+    first call with a new shape, `cache_dir` keeps the results across processes.
+    `max_batch_size` (by default TTS_MAX_BATCH_SIZE) sets the recompile limit.
+    """
+    cache_dir = set_cache_dir(cache_dir)
+    import torch._dynamo.config as dynamo_config
+
+    limit = recompile_limit(max_batch_size)
+    for name in ("recompile_limit", "cache_size_limit"):
+        if hasattr(dynamo_config, name):
+            setattr(dynamo_config, name, max(getattr(dynamo_config, name), limit))
+    for name in TEXT_MODULES:
+        getattr(model, name).compile(dynamic=False, mode=mode)
+    for name in FRAME_MODULES:
+        getattr(model, name).compile(dynamic=True, mode=mode)
+    # the compiled graphs fuse the speaker projections themselves
+    model.cache_speakers = False
+    logger.info(
+        f"Compiled {', '.join(TEXT_MODULES + FRAME_MODULES)} (up to {limit} graphs each), cache in {cache_dir}"
+    )
+    return model
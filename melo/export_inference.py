@@ -0,0 +1,27 @@
+import os
+import json
+import click
+from melo import utils
+from melo.api import TTS
+
+
+@click.command()
+@click.option('--language', '-l', type=str, default="EN", help="Language of the model")
+@click.option('--ckpt_path', '-m', type=str, default=None, help="Training checkpoint, by default the released one")
+@click.option('--config_path', '-c', type=str, default=None, help="Its config.json, by default the released one")
+@click.option('--output_dir', '-o', type=str, required=True, help="Directory for checkpoint.pth and config.json")
+def main(language, ckpt_path, config_path, output_dir):
+    """
+    Save the inference build of a model (no weight norm, no posterior encoder,
+    folded input scalings) as a compact checkpoint, next to its config. Load it with
+    TTS(language, config_path=<output_dir>/config.json, ckpt_path=<output_dir>/checkpoint.pth).
+    """
+    model = TTS(language=language, device='cpu', config_path=config_path, ckpt_path=ckpt_path)
+    os.makedirs(output_dir, exist_ok=True)
+    utils.save_inference_checkpoint(model.model, os.path.join(output_dir, 'checkpoint.pth'))
+    with open(os.path.join(output_dir, 'config.json'), 'w', encoding='utf-8') as f:
+        json.dump(model.hps.to_dict(), f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
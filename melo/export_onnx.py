@@ -0,0 +1,128 @@
+import os
+import json
+import click
+import torch
+from torch import nn
+from melo.api import TTS
+from melo.onnx_engine import GRAPHS
+
+OPSET = 17
+
+
+class EncoderGraph(nn.Module):
+    """
+    Text encoder and both duration predictors. Returns the prior statistics, the
+    length scaled (not yet rounded) phone durations, the text mask and the speaker
+    embedding used by the other graphs. `sdp_noise` [b, 2, t] is the noise of the
+    stochastic duration predictor.
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x, x_lengths, sid, tone, language, bert, ja_bert, sdp_noise, noise_scale_w, sdp_ratio,
+                length_scale):
+        model = self.model
+        g = model.emb_g(sid).unsqueeze(-1)
+        g_p = None if model.use_vc else g
+        x, m_p, logs_p, x_mask = model.enc_p(x, x_lengths, tone, language, bert, ja_bert, g=g_p)
+        logw_sdp = model.sdp(x, x_mask, g=g, reverse=True, noise_scale=noise_scale_w, noise=sdp_noise)
+        logw_dp = model.dp(x, x_mask, g=g)
+        logw = logw_sdp * sdp_ratio + logw_dp * (1 - sdp_ratio)
+        w = torch.exp(logw) * x_mask * length_scale
+        return m_p, logs_p, w, x_mask, g
+
+
+class FlowGraph(nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.flow = model.flow
+
+    def forward(self, z_p, y_mask, g):
+        return self.flow(z_p, y_mask, g=g, reverse=True)
+
+
+class DecoderGraph(nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.dec = model.dec
+
+    def forward(self, z, y_mask, g):
+        return self.dec(z * y_mask, g=g, x_mask=y_mask)
+
+
+def _export(module, args, path, input_names, output_names, dynamic_axes, opset):
+    # the exporter restores the mode of `module` afterwards, which a new wrapper would
+    # otherwise switch back to training
+    torch.onnx.export(
+        module.eval(), args, path, input_names=input_names, output_names=output_names,
+        dynamic_axes=dynamic_axes, opset_version=opset, dynamo=False,
+    )
+
+
+@torch.no_grad()
+def export(model, hps, output_dir, opset=OPSET):
+    """
+    Export the acoustic model `SynthesizerTrn` as the three graphs of `GRAPHS`, with
+    dynamic batch and length axes, and its config, into `output_dir` for `OnnxTTS`.
+    """
+    assert model.n_speakers > 0, "only models with speaker embeddings can be exported"
+    model = model.eval()
+    os.makedirs(output_dir, exist_ok=True)
+    b, t, frames = 1, 64, 256
+    x = torch.randint(1, len(hps.symbols), (b, t))
+    text_inputs = (
+        x, torch.LongTensor([t]), torch.LongTensor([0]), torch.zeros_like(x), torch.zeros_like(x),
+        torch.randn(b, model.enc_p.bert_proj.in_channels, t), torch.randn(b, model.enc_p.ja_bert_proj.in_channels, t),
+        torch.randn(b, 2, t), torch.tensor(0.8), torch.tensor(0.2), torch.tensor(1.0),
+    )
+    text = {0: "batch", 1: "phones"}
+    features = {0: "batch", 2: "phones"}
+    _export(
+        EncoderGraph(model), text_inputs, os.path.join(output_dir, GRAPHS["encoder"]),
+        ["x", "x_lengths", "sid", "tone", "language", "bert", "ja_bert", "sdp_noise", "noise_scale_w", "sdp_ratio",
+         "length_scale"],
+        ["m_p", "logs_p", "w", "x_mask", "g"],
+        {"x": text, "x_lengths": {0: "batch"}, "sid": {0: "batch"}, "tone": text, "language": text,
+         "bert": features, "ja_bert": features, "sdp_noise": features, "m_p": features, "logs_p": features,
+         "w": features, "x_mask": features, "g": {0: "batch"}},
+        opset,
+    )
+    latent = {0: "batch", 2: "frames"}
+    frame_inputs = (
+        torch.randn(b, model.inter_channels, frames), torch.ones(b, 1, frames), torch.randn(b, model.gin_channels, 1),
+    )
+    _export(
+        FlowGraph(model), frame_inputs, os.path.join(output_dir, GRAPHS["flow"]),
+        ["z_p", "y_mask", "g"], ["z"],
+        {"z_p": latent, "y_mask": latent, "g": {0: "batch"}, "z": latent},
+        opset,
+    )
+    _export(
+        DecoderGraph(model), frame_inputs, os.path.join(output_dir, GRAPHS["decoder"]),
+        ["z", "y_mask", "g"], ["audio"],
+        {"z": latent, "y_mask": latent, "g": {0: "batch"}, "audio": {0: "batch", 2: "samples"}},
+        opset,
+    )
+    with open(os.path.join(output_dir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(hps.to_dict(), f, indent=2, ensure_ascii=False)
+
+
+@click.command()
+@click.option('--language', '-l', type=str, default="EN", help="Language of the model")
+@click.option('--ckpt_path', '-m', type=str, default=None, help="Checkpoint, by default the released one")
+@click.option('--config_path', '-c', type=str, default=None, help="Its config.json, by default the released one")
+@click.option('--output_dir', '-o', type=str, required=True, help="Directory for the ONNX graphs and config.json")
+@click.option('--opset', type=int, default=OPSET, show_default=True)
+def main(language, ckpt_path, config_path, output_dir, opset):
+    """
+    Export the acoustic model as ONNX graphs (text encoder with the duration
+    predictors, flow, decoder) for melo.onnx_engine.OnnxTTS.
+    """
+    tts = TTS(language=language, device='cpu', config_path=config_path, ckpt_path=ckpt_path)
+    export(tts.model, tts.hps, output_dir, opset)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+_sink = None
+_local = threading.local()
+_null = nullcontext()
+
+
+def set_sink(sink):
+    """
+    Install `sink` (an object with `timing(stage, language, seconds)` and
+    `value(name, language, value)`), None to switch the hooks off again.
+    """
+    global _sink
+    _sink = sink
+
+
+def current_language():
+    return getattr(_local, "language", None)
+
+
+@contextmanager
+def language_scope(language):
+    previous = current_language()
+    _local.language = language
+    try:
+        yield
+    finally:
+        _local.language = previous
+
+
+class _Timer:
+    __slots__ = ("sink", "stage", "language", "start")
+
+    def __init__(self, sink, stage, language):
+        self.sink = sink
+        self.stage = stage
+        self.language = language
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.sink.timing(self.stage, self.language, time.perf_counter() - self.start)
+        return False
+
+
+def timed(stage, language=None):
+    """
+    Context manager timing one pipeline stage (text_normalization, g2p, bert,
+    enc_p, duration, flow, decoder, audio_encoding). A no-op until a sink is
+    installed with `set_sink`. Stages that do not know their language (the
+    acoustic model) take it from the enclosing `language_scope`. On GPU the model
+    stages are timed without synchronizing.
+    """
+    sink = _sink
+    if sink is None:
+        return _null
+    return _Timer(sink, stage, language or current_language())
+
+
+def observe(name, value, language=None):
+    sink = _sink
+    if sink is not None:
+        sink.value(name, language or current_language(), value)
+
+
+class PrometheusSink:
+    """
+    Sink exporting the hooks as Prometheus histograms, plus gauges whose values are
+    read at scrape time (`add_gauge`). Needs the prometheus-client package.
+    """
+
+    STAGE_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30.)
+    VALUE_BUCKETS = {
+        "batch_size": (1, 2, 4, 8, 16, 32, 64),
+        "realtime_factor": (.5, 1., 2., 5., 10., 20., 50., 100.),
+    }
+
+    def __init__(self, namespace="melotts"):
+        from prometheus_client import CollectorRegistry, Histogram
+
+        self.namespace = namespace
+        self.registry = CollectorRegistry()
+        self._gauges = []
+        self.stage_seconds = Histogram(
+            "stage_seconds", "Wall time of a synthesis pipeline stage",
+            ["stage", "language"], namespace=namespace, registry=self.registry, buckets=self.STAGE_BUCKETS,
+        )
+        self.values = {
+            name: Histogram(
+                name, doc, ["language"], namespace=namespace, registry=self.registry,
+                buckets=self.VALUE_BUCKETS[name],
+            )
+            for name, doc in [
+                ("batch_size", "Sentences per forward pass of the acoustic model"),
+                ("realtime_factor", "Seconds of audio synthesized per second of wall time"),
+            ]
+        }
+        self.registry.register(self)
+
+    def timing(self, stage, language, seconds):
+        self.stage_seconds.labels(stage, language or "").observe(seconds)
+
+    def value(self, name, language, value):
+        histogram = self.values.get(name)
+        if histogram is not None:
+            histogram.labels(language or "").observe(value)
+
+    def add_gauge(self, name, doc, fn, label=None):
+        """
+        Gauge computed by `fn()` on every scrape, either a number or, with `label`,
+        a dict of label value -> number.
+        """
+        self._gauges.append((name, doc, fn, label))
+
+    def collect(self):
+        from prometheus_client.core import GaugeMetricFamily
+
+        for name, doc, fn, label in self._gauges:
+            full_name = f"{self.namespace}_{name}"
+            if label is None:
+                yield GaugeMetricFamily(full_name, doc, value=fn())
+                continue
+            gauge = GaugeMetricFamily(full_name, doc, labels=[label])
+            for label_value, value in fn().items():
+                gauge.add_metric([label_value], value)
+            yield gauge
+
+    def describe(self):
+        # gauges are only known at scrape time, avoid collect() during registration
+        return []
+
+    def generate(self):
+        from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+
+        return generate_latest(self.registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,208 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from melo.download_utils import load_or_download_config
+
+logger = logging.getLogger(__name__)
+
+
+def module_nbytes(module):
+    if module is None:
+        return 0
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ModelRegistry:
+    """
+    Dict-like access to the `TTS` models of `languages` that loads a model on its
+    first use instead of at startup.
+
+    `factory(language)` builds the model. Loaded models are kept in LRU order; when
+    more than `max_models` are loaded or their estimated size (weights of the
+    acoustic and the BERT model) exceeds `max_memory_mb`, the least recently used
+    ones are dropped. The model that was just requested is never evicted, so one
+    model larger than the budget still works.
+
+    A model is only handed out after `TTS.warmup`. With `frontend=False` it is not
+    warmed up and the BERT models are left to be loaded lazily, e.g. when worker
+    processes run the frontend.
+    """
+
+    def __init__(self, languages, factory, max_models=None, max_memory_mb=None, use_hf=True, frontend=True):
+        self.languages = list(languages)
+        self.factory = factory
+        self.max_models = max_models or None
+        self.max_bytes = int(max_memory_mb * 2**20) if max_memory_mb else None
+        self.use_hf = use_hf
+        self.frontend = frontend
+        self._models = OrderedDict()
+        self._sizes = {}
+        self._hps = {}
+        self._lock = threading.Lock()
+        self._load_locks = {language: threading.Lock() for language in self.languages}
+        self._warmup_thread = None
+        self._warmed_up = threading.Event()
+        self._warmed_up.set()
+        # language -> error of its last failed preload
+        self._failed = {}
+
+    def __contains__(self, language):
+        return language in self.languages
+
+    def __iter__(self):
+        return iter(self.languages)
+
+    def __len__(self):
+        return len(self.languages)
+
+    def __getitem__(self, language):
+        if language not in self.languages:
+            raise KeyError(language)
+        with self._lock:
+            model = self._models.get(language)
+            if model is not None:
+                self._models.move_to_end(language)
+                return model
+        # one lock per language: concurrent first requests wait for a single load
+        with self._load_locks[language]:
+            with self._lock:
+                model = self._models.get(language)
+                if model is not None:
+                    self._models.move_to_end(language)
+                    return model
+            logger.info(f"Loading TTS model for {language}")
+            model = self.factory(language)
+            size = module_nbytes(model.model)
+            if self.frontend:
+                size += module_nbytes(model.load_frontend())
+                logger.info(f"Warmed up TTS model for {language} in {model.warmup():.2f}s")
+            with self._lock:
+                self._models[language] = model
+                self._failed.pop(language, None)
+                self._sizes[language] = size
+                self._hps[language] = model.hps
+                evicted = self._evict(keep=language)
+            self._unload_frontends(evicted)
+            for name in evicted:
+                logger.info(f"Evicted TTS model for {name} (least recently used)")
+            logger.info(f"Loaded TTS model for {language} ({size / 2**20:.0f} MB)")
+            return model
+
+    def get(self, language, default=None):
+        """
+        The model of `language`, loaded if needed; `default` for languages not served.
+        """
+        if language not in self.languages:
+            return default
+        return self[language]
+
+    def get_hps(self, language):
+        """
+        Config of `language` without loading its model, e.g. to list speakers.
+        """
+        with self._lock:
+            hps = self._hps.get(language)
+        if hps is None:
+            if language not in self.languages:
+                raise KeyError(language)
+            hps = load_or_download_config(language, use_hf=self.use_hf)
+            with self._lock:
+                self._hps.setdefault(language, hps)
+        return hps
+
+    def is_loaded(self, language):
+        with self._lock:
+            return language in self._models
+
+    def loaded(self):
+        """
+        Languages with a loaded model, least recently used first.
+        """
+        with self._lock:
+            return list(self._models)
+
+    def loaded_items(self):
+        with self._lock:
+            return list(self._models.items())
+
+    def memory_bytes(self):
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def unload(self, language):
+        with self._lock:
+            model = self._models.pop(language, None)
+            self._sizes.pop(language, None)
+        if model is not None:
+            self._unload_frontends({language: model})
+            logger.info(f"Unloaded TTS model for {language}")
+
+    def _unload_frontends(self, models):
+        # outside self._lock: unloading waits for BERT loads in progress. A BERT model
+        # shared with a language that is still loaded stays.
+        with self._lock:
+            in_use = {model.frontend_key() for model in self._models.values()}
+        for model in models.values():
+            key = model.frontend_key()
+            if key is None or key not in in_use:
+                model.unload_frontend()
+
+    def _evict(self, keep):
+        # caller holds self._lock; returns the evicted models, whose frontends the
+        # caller unloads after releasing it
+        evicted = {}
+        while len(self._models) > 1 and (
+            (self.max_models is not None and len(self._models) > self.max_models)
+            or (self.max_bytes is not None and sum(self._sizes.values()) > self.max_bytes)
+        ):
+            language = next(lang for lang in self._models if lang != keep)
+            evicted[language] = self._models.pop(language)
+            self._sizes.pop(language)
+        return evicted
+
+    def is_ready(self):
+        """
+        Whether the models of the last `warmup` call are loaded and warmed up. False
+        while one of them failed to load, until a later load of it succeeds.
+        """
+        with self._lock:
+            failed = bool(self._failed)
+        return self._warmed_up.is_set() and not failed
+
+    def failed(self):
+        """
+        Languages whose preload failed, with the error.
+        """
+        with self._lock:
+            return dict(self._failed)
+
+    def warmup(self, languages, background=True):
+        """
+        Load `languages` in order, by default in a background thread.
+        """
+        languages = [lang for lang in languages if lang in self.languages]
+
+        def load_all():
+            try:
+                for language in languages:
+                    try:
+                        self[language]
+                    except Exception as e:
+                        logger.error(f"Failed to load model for {language}: {e}")
+                        with self._lock:
+                            self._failed[language] = str(e)
+            finally:
+                self._warmed_up.set()
+
+        self._warmed_up.clear()
+        with self._lock:
+            for language in languages:
+                self._failed.pop(language, None)
+        if not background:
+            load_all()
+            return None
+        self._warmup_thread = threading.Thread(target=load_all, name="tts-model-warmup", daemon=True)
+        self._warmup_thread.start()
+        return self._warmup_thread
@@ -6,6 +6,9 @@ from torch.nn import functional as F
 from melo import commons
 from melo import modules
 from melo import attentions
+from melo import metrics
+from melo.profiler import NULL_PROFILER
+from melo.quantize import QuantizedConv1d
 
 from torch.nn import Conv1d, ConvTranspose1d, Conv2d
 from torch.nn.utils import weight_norm, remove_weight_norm, spectral_norm
@@ -69,8 +72,8 @@ class DurationDiscriminator(nn.Module):  # vits2
     def forward(self, x, x_mask, dur_r, dur_hat, g=None):
         x = torch.detach(x)
         if g is not None:
-            g = torch.detach(g)
-            x = x + self.cond(g)
+            g = g.detach()
+            x = x + commons.speaker_projection(self.cond, g)
         x = self.conv_1(x * x_mask)
         x = torch.relu(x)
         x = self.norm_1(x)
@@ -203,12 +206,13 @@ class StochasticDurationPredictor(nn.Module):
         if gin_channels != 0:
             self.cond = nn.Conv1d(gin_channels, filter_channels, 1)
 
-    def forward(self, x, x_mask, w=None, g=None, reverse=False, noise_scale=1.0):
+    def forward(self, x, x_mask, w=None, g=None, reverse=False, noise_scale=1.0, generator=None, noise=None):
+        # noise: the [b, 2, t] standard normal noise of reverse mode, sampled when None
         x = torch.detach(x)
         x = self.pre(x)
         if g is not None:
-            g = torch.detach(g)
-            x = x + self.cond(g)
+            g = g.detach()
+            x = x + commons.speaker_projection(self.cond, g)
         x = self.convs(x, x_mask)
         x = self.proj(x) * x_mask
 
@@ -254,10 +258,13 @@ class StochasticDurationPredictor(nn.Module):
         else:
             flows = list(reversed(self.flows))
             flows = flows[:-2] + [flows[-1]]  # remove a useless vflow
-            z = (
-                torch.randn(x.size(0), 2, x.size(2)).to(device=x.device, dtype=x.dtype)
-                * noise_scale
-            )
+            if noise is None and generator is None:
+                noise = torch.randn(x.size(0), 2, x.size(2))
+            elif noise is None:
+                noise = commons.randn_seeded(
+                    (x.size(0), 2, x.size(2)), x_mask.sum([1, 2]).long().tolist(), generator
+                )
+            z = noise.to(device=x.device, dtype=x.dtype) * noise_scale
             for flow in flows:
                 z = flow(z, x_mask, g=x, reverse=reverse)
             z0, z1 = torch.split(z, [1, 1], 1)
@@ -294,8 +301,8 @@ class DurationPredictor(nn.Module):
     def forward(self, x, x_mask, g=None):
         x = torch.detach(x)
         if g is not None:
-            g = torch.detach(g)
-            x = x + self.cond(g)
+            g = g.detach()
+            x = x + commons.speaker_projection(self.cond, g)
         x = self.conv_1(x * x_mask)
         x = torch.relu(x)
         x = self.norm_1(x)
@@ -337,6 +344,8 @@ class TextEncoder(nn.Module):
         self.kernel_size = kernel_size
         self.p_dropout = p_dropout
         self.gin_channels = gin_channels
+        # sqrt(hidden_channels), 1 once folded into the embeddings by `fold_emb_scale`
+        self.emb_scale = math.sqrt(hidden_channels)
         self.emb = nn.Embedding(n_vocab, hidden_channels)
         nn.init.normal_(self.emb.weight, 0.0, hidden_channels**-0.5)
         self.tone_emb = nn.Embedding(num_tones, hidden_channels)
@@ -366,9 +375,9 @@ class TextEncoder(nn.Module):
             + self.language_emb(language)
             + bert_emb
             + ja_bert_emb
-        ) * math.sqrt(
-            self.hidden_channels
         )  # [b, t, h]
+        if self.emb_scale != 1:
+            x = x * self.emb_scale
         x = torch.transpose(x, 1, -1)  # [b, h, t]
         x_mask = torch.unsqueeze(commons.sequence_mask(x_lengths, x.size(2)), 1).to(
             x.dtype
@@ -380,6 +389,14 @@ class TextEncoder(nn.Module):
         m, logs = torch.split(stats, self.out_channels, dim=1)
         return x, m, logs, x_mask
 
+    @torch.no_grad()
+    def fold_emb_scale(self):
+        # the input sum is linear in all of these weights
+        for layer in [self.emb, self.tone_emb, self.language_emb, self.bert_proj, self.ja_bert_proj]:
+            for param in layer.parameters():
+                param.mul_(self.emb_scale)
+        self.emb_scale = 1.0
+
 
 class ResidualCouplingBlock(nn.Module):
     def __init__(
@@ -483,6 +500,7 @@ class Generator(torch.nn.Module):
         super(Generator, self).__init__()
         self.num_kernels = len(resblock_kernel_sizes)
         self.num_upsamples = len(upsample_rates)
+        self.upsample_rates = upsample_rates
         self.conv_pre = Conv1d(
             initial_channel, upsample_initial_channel, 7, 1, padding=3
         )
@@ -516,20 +534,27 @@ class Generator(torch.nn.Module):
         if gin_channels != 0:
             self.cond = nn.Conv1d(gin_channels, upsample_initial_channel, 1)
 
-    def forward(self, x, g=None):
+    def forward(self, x, g=None, x_mask=None):
+        # x_mask is only needed for padded batches, it keeps the padding of
+        # shorter items from leaking into their last frames
         x = self.conv_pre(x)
         if g is not None:
-            x = x + self.cond(g)
+            x = x + commons.speaker_projection(self.cond, g)
+        if x_mask is not None:
+            x = x * x_mask
 
         for i in range(self.num_upsamples):
             x = F.leaky_relu(x, modules.LRELU_SLOPE)
             x = self.ups[i](x)
+            if x_mask is not None:
+                x_mask = torch.repeat_interleave(x_mask, self.upsample_rates[i], dim=2)
+                x = x * x_mask
             xs = None
             for j in range(self.num_kernels):
                 if xs is None:
-                    xs = self.resblocks[i * self.num_kernels + j](x)
+                    xs = self.resblocks[i * self.num_kernels + j](x, x_mask)
                 else:
-                    xs += self.resblocks[i * self.num_kernels + j](x)
+                    xs += self.resblocks[i * self.num_kernels + j](x, x_mask)
             x = xs / self.num_kernels
         x = F.leaky_relu(x)
         x = self.conv_post(x)
@@ -537,6 +562,54 @@ class Generator(torch.nn.Module):
 
         return x
 
+    def receptive_field(self):
+        """
+        Number of input frames on each side that can influence the output of a frame.
+        """
+        radius = (self.conv_pre.kernel_size[0] - 1) // 2
+        rate = 1
+        for i, up in enumerate(self.ups):
+            # a transposed conv output sample sees ceil(k / u) input frames
+            radius += math.ceil(math.ceil(up.kernel_size[0] / up.stride[0]) / 2) / rate
+            rate *= up.stride[0]
+            stage_radius = 0
+            for j in range(self.num_kernels):
+                convs = [m for m in self.resblocks[i * self.num_kernels + j].modules() if isinstance(m, (Conv1d, QuantizedConv1d))]
+                stage_radius = max(stage_radius, sum(c.dilation[0] * (c.kernel_size[0] - 1) // 2 for c in convs))
+            radius += stage_radius / rate
+        radius += ((self.conv_post.kernel_size[0] - 1) // 2) / rate
+        return math.ceil(radius)
+
+    def forward_stream(self, x, g=None, chunk_size=32, context=None, crossfade=256):
+        """
+        Decode `x` [b, c, t] window by window along time and yield [b, 1, samples] blocks
+        as soon as they are ready.
+
+        Every window of `chunk_size` frames is decoded with `context` extra frames on both
+        sides (defaults to the receptive field), which are cut off again. Consecutive blocks
+        overlap by `crossfade` samples that are linearly crossfaded, so the blocks
+        concatenate to the output of `forward` without seams.
+        """
+        if context is None:
+            context = self.receptive_field()
+        hop = math.prod(self.upsample_rates)
+        length = x.size(2)
+        tail = None
+        for start in range(0, length, chunk_size):
+            end = min(length, start + chunk_size)
+            lo, hi = max(0, start - context), min(length, end + context)
+            o = self.forward(x[:, :, lo:hi], g=g)
+            n = (end - start) * hop
+            extra = min(crossfade, (hi - end) * hop) if end < length else 0
+            offset = (start - lo) * hop
+            block = o[:, :, offset:offset + n + extra]
+            if tail is not None:
+                k = tail.size(2)
+                fade = torch.linspace(0, 1, k + 2, device=o.device, dtype=o.dtype)[1:-1]
+                block = torch.cat([tail * (1 - fade) + block[:, :, :k] * fade, block[:, :, k:]], dim=2)
+            tail = block[:, :, n:] if extra else None
+            yield block[:, :, :n]
+
     def remove_weight_norm(self):
         print("Removing weight norm...")
         for layer in self.ups:
@@ -883,6 +956,63 @@ class SynthesizerTrn(nn.Module):
         else:
             self.ref_enc = ReferenceEncoder(spec_channels, gin_channels, layernorm=norm_refenc)
         self.use_vc = use_vc
+        # conditioning layer -> its output for every speaker, see `speaker_cond`
+        self._speaker_cache = {}
+        # set by `prepare_for_inference`
+        self.inference_build = False
+        # off in `compiled.compile_model`, the compiled graphs take plain tensors
+        self.cache_speakers = True
+
+    def speaker_cond(self, sid):
+        """
+        Speaker conditioning for `sid` [b]. In eval mode it is a `commons.SpeakerCond`:
+        the 1x1 projections of the speaker embedding in the encoder, duration
+        predictors, flows and decoder are computed once for all speakers and then
+        looked up, instead of being recomputed by every call.
+        """
+        g = self.emb_g(sid).unsqueeze(-1)
+        if self.training or not self.cache_speakers:
+            return g
+        return commons.SpeakerCond(g, sid, self.emb_g.weight, self._speaker_cache)
+
+    def clear_speaker_cache(self):
+        self._speaker_cache.clear()
+
+    def train(self, mode=True):
+        self.clear_speaker_cache()
+        return super().train(mode)
+
+    def _apply(self, fn, *args, **kwargs):
+        # device and dtype changes
+        self.clear_speaker_cache()
+        return super()._apply(fn, *args, **kwargs)
+
+    def load_state_dict(self, *args, **kwargs):
+        self.clear_speaker_cache()
+        return super().load_state_dict(*args, **kwargs)
+
+    def prepare_for_inference(self):
+        """
+        Turn the model into its inference build, in place: remove the weight norm of
+        every layer, drop the posterior encoder `enc_q` (only used by training and
+        `voice_conversion`) and fold the constant input scalings of the text encoder
+        and the attention layers into the weights. The outputs of `infer` stay the
+        same up to float rounding. Its state dict is what `utils.save_inference_checkpoint`
+        writes; load such a checkpoint into a model prepared the same way.
+        """
+        if self.inference_build:
+            return self
+        self.eval()
+        self.enc_q = None
+        for module in self.modules():
+            if hasattr(module, "weight_g"):
+                remove_weight_norm(module)
+            if isinstance(module, attentions.MultiHeadAttention):
+                module.fold_query_scale()
+        self.enc_p.fold_emb_scale()
+        self.inference_build = True
+        self.clear_speaker_cache()
+        return self
 
 
     def forward(self, x, x_lengths, y, y_lengths, sid, tone, language, bert, ja_bert):
@@ -979,46 +1109,127 @@ class SynthesizerTrn(nn.Module):
         sdp_ratio=0,
         y=None,
         g=None,
+        generator=None,
+        profiler=None,
     ):
+        # profiler: melo.profiler.Profiler recording every stage below
+        profiler = profiler if profiler is not None else NULL_PROFILER
+        z, y_mask, g, attn, latents = self.infer_latent(
+            x, x_lengths, sid, tone, language, bert, ja_bert,
+            noise_scale=noise_scale,
+            length_scale=length_scale,
+            noise_scale_w=noise_scale_w,
+            sdp_ratio=sdp_ratio,
+            y=y,
+            g=g,
+            generator=generator,
+            profiler=profiler,
+        )
+        dec_mask = y_mask[:, :, :max_len] if x.size(0) > 1 else None
+        with metrics.timed("decoder"), profiler.stage("dec", batch=z.size(0), T_frames=z.size(2)) as shapes:
+            o = self.dec((z * y_mask)[:, :, :max_len], g=g, x_mask=dec_mask)
+            shapes["samples"] = o.size(-1)
+        # print('max/min of o:', o.max(), o.min())
+        return o, attn, y_mask, latents
+
+    def infer_latent(
+        self,
+        x,
+        x_lengths,
+        sid,
+        tone,
+        language,
+        bert,
+        ja_bert,
+        noise_scale=0.667,
+        length_scale=1,
+        noise_scale_w=0.8,
+        sdp_ratio=0,
+        y=None,
+        g=None,
+        generator=None,
+        profiler=None,
+    ):
+        # generator: torch.Generator or one per batch item for reproducible sampling,
+        # None uses the global RNG
+        profiler = profiler if profiler is not None else NULL_PROFILER
+        shapes = dict(batch=x.size(0), T_text=x.size(1))
         # x, m_p, logs_p, x_mask = self.enc_p(x, x_lengths, tone, language, bert)
         # g = self.gst(y)
         if g is None:
             if self.n_speakers > 0:
-                g = self.emb_g(sid).unsqueeze(-1)  # [b, h, 1]
+                g = self.speaker_cond(sid)  # [b, h, 1]
             else:
                 g = self.ref_enc(y.transpose(1, 2)).unsqueeze(-1)
         if self.use_vc:
             g_p = None
         else:
             g_p = g
-        x, m_p, logs_p, x_mask = self.enc_p(
-            x, x_lengths, tone, language, bert, ja_bert, g=g_p
+        with metrics.timed("enc_p"), profiler.stage("enc_p", **shapes):
+            x, m_p, logs_p, x_mask = self.enc_p(
+                x, x_lengths, tone, language, bert, ja_bert, g=g_p
+            )
+        with metrics.timed("duration"):
+            with profiler.stage("sdp", **shapes):
+                logw_sdp = self.sdp(x, x_mask, g=g, reverse=True, noise_scale=noise_scale_w, generator=generator)
+            with profiler.stage("dp", **shapes):
+                logw_dp = self.dp(x, x_mask, g=g)
+            logw = logw_sdp * sdp_ratio + logw_dp * (1 - sdp_ratio)
+            w = torch.exp(logw) * x_mask * length_scale
+
+            w_ceil = torch.ceil(w)
+            y_lengths = torch.clamp_min(torch.sum(w_ceil, [1, 2]), 1).long()
+            y_mask = torch.unsqueeze(commons.sequence_mask(y_lengths, None), 1).to(
+                x_mask.dtype
+            )
+            shapes["T_frames"] = y_mask.size(2)
+            with profiler.stage("generate_path", **shapes):
+                attn_mask = torch.unsqueeze(x_mask, 2) * torch.unsqueeze(y_mask, -1)
+                attn = commons.generate_path(w_ceil, attn_mask)
+
+                m_p = torch.matmul(attn.squeeze(1), m_p.transpose(1, 2)).transpose(
+                    1, 2
+                )  # [b, t', t], [b, t, d] -> [b, d, t']
+                logs_p = torch.matmul(attn.squeeze(1), logs_p.transpose(1, 2)).transpose(
+                    1, 2
+                )  # [b, t', t], [b, t, d] -> [b, d, t']
+
+        with metrics.timed("flow"), profiler.stage("flow", **shapes):
+            if generator is None:
+                noise = torch.randn_like(m_p)
+            else:
+                noise = commons.randn_seeded(m_p.shape, y_lengths.tolist(), generator).to(m_p)
+            z_p = m_p + noise * torch.exp(logs_p) * noise_scale
+            z = self.flow(z_p, y_mask, g=g, reverse=True)
+        return z, y_mask, g, attn, (z, z_p, m_p, logs_p)
+
+    @torch.no_grad()
+    def infer_stream(
+        self,
+        x,
+        x_lengths,
+        sid,
+        tone,
+        language,
+        bert,
+        ja_bert,
+        chunk_size=32,
+        context=None,
+        crossfade=256,
+        **kwargs
+    ):
+        """
+        Like `infer` for a single sentence, but vocodes the latent in overlapping
+        windows of `chunk_size` frames and yields [1, 1, samples] audio blocks as
+        soon as each window is decoded. See `Generator.forward_stream`.
+        """
+        assert x.size(0) == 1, "infer_stream only supports a batch size of 1"
+        z, y_mask, g, _, _ = self.infer_latent(
+            x, x_lengths, sid, tone, language, bert, ja_bert, **kwargs
         )
-        logw = self.sdp(x, x_mask, g=g, reverse=True, noise_scale=noise_scale_w) * (
-            sdp_ratio
-        ) + self.dp(x, x_mask, g=g) * (1 - sdp_ratio)
-        w = torch.exp(logw) * x_mask * length_scale
-        
-        w_ceil = torch.ceil(w)
-        y_lengths = torch.clamp_min(torch.sum(w_ceil, [1, 2]), 1).long()
-        y_mask = torch.unsqueeze(commons.sequence_mask(y_lengths, None), 1).to(
-            x_mask.dtype
+        yield from self.dec.forward_stream(
+            z * y_mask, g=g, chunk_size=chunk_size, context=context, crossfade=crossfade
         )
-        attn_mask = torch.unsqueeze(x_mask, 2) * torch.unsqueeze(y_mask, -1)
-        attn = commons.generate_path(w_ceil, attn_mask)
-
-        m_p = torch.matmul(attn.squeeze(1), m_p.transpose(1, 2)).transpose(
-            1, 2
-        )  # [b, t', t], [b, t, d] -> [b, d, t']
-        logs_p = torch.matmul(attn.squeeze(1), logs_p.transpose(1, 2)).transpose(
-            1, 2
-        )  # [b, t', t], [b, t, d] -> [b, d, t']
-
-        z_p = m_p + torch.randn_like(m_p) * torch.exp(logs_p) * noise_scale
-        z = self.flow(z_p, y_mask, g=g, reverse=True)
-        o = self.dec((z * y_mask)[:, :, :max_len], g=g)
-        # print('max/min of o:', o.max(), o.min())
-        return o, attn, y_mask, (z, z_p, m_p, logs_p)
 
     def voice_conversion(self, y, y_lengths, sid_src, sid_tgt, tau=1.0):        
         g_src = sid_src
@@ -187,7 +187,7 @@ class WN(torch.nn.Module):
         n_channels_tensor = torch.IntTensor([self.hidden_channels])
 
         if g is not None:
-            g = self.cond_layer(g)
+            g = commons.speaker_projection(self.cond_layer, g)
 
         for i in range(self.n_layers):
             x_in = self.in_layers[i](x)
@@ -0,0 +1,129 @@
+import os
+import hashlib
+
+import numpy as np
+import torch
+from torch import nn
+
+from . import utils
+from . import commons
+from . import metrics
+from .api import TTS
+
+# graphs written by `melo.export_onnx`, next to the config.json of the model
+GRAPHS = {
+    "encoder": "encoder.onnx",
+    "flow": "flow.onnx",
+    "decoder": "decoder.onnx",
+}
+
+# the relative attention of the exported text encoder needs more phones than its
+# window, shorter inputs are padded
+MIN_PHONES = 16
+
+
+def _checksum(model_dir):
+    h = hashlib.sha256()
+    for name in sorted(GRAPHS.values()):
+        with open(os.path.join(model_dir, name), "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+def generate_path(duration, x_mask, y_mask):
+    """
+    `commons.generate_path` in NumPy. duration, x_mask: [b, 1, t_x], y_mask: [b, 1, t_y].
+    Returns the [b, t_x, t_y] alignment of every phone to its frames.
+    """
+    cum_duration = np.cumsum(duration[:, 0], axis=-1)
+    frames = np.arange(y_mask.shape[-1])
+    path = (frames[None, None, :] < cum_duration[:, :, None]).astype(np.float32)
+    path[:, 1:] -= path[:, :-1].copy()
+    return path * x_mask[:, 0, :, None] * y_mask
+
+
+class OnnxTTS(TTS):
+    """
+    `TTS` running the acoustic model exported by `melo.export_onnx` in onnxruntime.
+    The text frontend is the one of `TTS`; between the graphs, the durations are
+    rounded and the prior is expanded to frames in NumPy. Seeded outputs match the
+    ones of `TTS` up to float rounding. Sentences are not vocoded incrementally:
+    `tts_iter` raises a ValueError for a `chunk_size`.
+    """
+
+    def __init__(self, language, model_dir, feature_cache=None, audio_cache=None, providers=None, num_threads=None):
+        nn.Module.__init__(self)
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        providers = providers or ["CPUExecutionProvider"]
+        self.sessions = {
+            name: ort.InferenceSession(os.path.join(model_dir, path), options, providers=providers)
+            for name, path in GRAPHS.items()
+        }
+        hps = utils.get_hparams_from_file(os.path.join(model_dir, "config.json"))
+        self._setup(None, hps, language, 'cpu', _checksum(model_dir), feature_cache, audio_cache)
+
+    def infer_batch(self, features, speaker_ids, sdp_ratio=0.2, noise_scale=0.6, noise_scale_w=0.8, speed=1.0, seeds=None,
+                    profiler=None):
+        """
+        See `TTS.infer_batch`; `profiler` is not supported.
+        """
+        if not isinstance(speaker_ids, (list, tuple)):
+            speaker_ids = [speaker_ids] * len(features)
+        x, x_lengths, tones, lang_ids, bert, ja_bert = self._pad_features(features)
+        if x.size(1) < MIN_PHONES:
+            pad = MIN_PHONES - x.size(1)
+            x, tones, lang_ids = [torch.nn.functional.pad(t, (0, pad)) for t in (x, tones, lang_ids)]
+            bert, ja_bert = [torch.nn.functional.pad(t, (0, pad)) for t in (bert, ja_bert)]
+        generator = self._generators(seeds)
+        batch_size, n_phones = x.shape
+
+        metrics.observe("batch_size", batch_size, self.language)
+        with metrics.language_scope(self.language):
+            # drawn in the same order as `SynthesizerTrn.infer`, so that a seed gives the same audio
+            sdp_noise = commons.randn_seeded((batch_size, 2, n_phones), x_lengths.tolist(), generator)
+            with metrics.timed("enc_p"):
+                m_p, logs_p, w, x_mask, g = self.sessions["encoder"].run(None, {
+                    "x": x.numpy(),
+                    "x_lengths": x_lengths.numpy(),
+                    "sid": np.asarray(speaker_ids, dtype=np.int64),
+                    "tone": tones.numpy(),
+                    "language": lang_ids.numpy(),
+                    "bert": bert.numpy(),
+                    "ja_bert": ja_bert.numpy(),
+                    "sdp_noise": sdp_noise.numpy(),
+                    "noise_scale_w": np.asarray(noise_scale_w, dtype=np.float32),
+                    "sdp_ratio": np.asarray(sdp_ratio, dtype=np.float32),
+                    "length_scale": np.asarray(1. / speed, dtype=np.float32),
+                })
+            with metrics.timed("duration"):
+                w_ceil = np.ceil(w)
+                y_lengths = np.maximum(w_ceil.sum(axis=(1, 2)), 1).astype(np.int64)
+                y_mask = (np.arange(y_lengths.max())[None, :] < y_lengths[:, None])[:, None].astype(np.float32)
+                attn = generate_path(w_ceil, x_mask, y_mask)
+                m_p = np.matmul(m_p, attn)
+                logs_p = np.matmul(logs_p, attn)
+            with metrics.timed("flow"):
+                if generator is None:
+                    noise = np.random.standard_normal(m_p.shape).astype(np.float32)
+                else:
+                    noise = commons.randn_seeded(m_p.shape, y_lengths.tolist(), generator).numpy()
+                z_p = m_p + noise * np.exp(logs_p) * noise_scale
+                z, = self.sessions["flow"].run(None, {"z_p": z_p, "y_mask": y_mask, "g": g})
+            with metrics.timed("decoder"):
+                o, = self.sessions["decoder"].run(None, {"z": z, "y_mask": y_mask, "g": g})
+        n_samples = y_lengths * self.hps.data.hop_length
+        return [o[i, 0, :n] for i, n in enumerate(n_samples)]
+
+    def tts_iter(self, text, speaker_id, sdp_ratio=0.2, noise_scale=0.6, noise_scale_w=0.8, speed=1.0, quiet=True, chunk_size=None, gap=0.05, seed=None, bert_provider=None):
+        if chunk_size is not None:
+            raise ValueError("OnnxTTS does not vocode incrementally, chunk_size must be None")
+        return super().tts_iter(
+            text, speaker_id, sdp_ratio=sdp_ratio, noise_scale=noise_scale, noise_scale_w=noise_scale_w, speed=speed,
+            quiet=quiet, gap=gap, seed=seed, bert_provider=bert_provider,
+        )
@@ -0,0 +1,153 @@
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+import torch
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# peak RSS before the last `reset_peak_rss`, which lowers ru_maxrss as well
+_peak_before_reset = 0
+
+
+def peak_rss_bytes():
+    """
+    Peak resident set size of this process so far, 0 where it is not available.
+    """
+    if resource is None:
+        return 0
+    # ru_maxrss is in bytes on macOS, in kilobytes elsewhere
+    unit = 1 if sys.platform == "darwin" else 1024
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit, _peak_before_reset)
+    try:
+        # ru_maxrss can lag behind VmHWM by a few pages
+        peak = max(peak, _status_bytes("VmHWM"))
+    except OSError:
+        pass
+    return peak
+
+
+def _status_bytes(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+    raise OSError(f"{field} not in /proc/self/status")
+
+
+def reset_peak_rss():
+    """
+    Reset the RSS high-water mark of this process (VmHWM) to its current RSS, so
+    that `peak_rss_since_reset` measures from now on. Linux only; returns False
+    where it is not possible.
+    """
+    global _peak_before_reset
+    try:
+        peak = _status_bytes("VmHWM")
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    _peak_before_reset = max(_peak_before_reset, peak)
+    return True
+
+
+def peak_rss_since_reset():
+    return _status_bytes("VmHWM")
+
+
+class Profiler:
+    """
+    Per-stage profile of `SynthesizerTrn.infer`, passed as `profiler=` to
+    `TTS.tts_to_file`, `TTS.infer_batch` or `SynthesizerTrn.infer`:
+
+        prof = Profiler()
+        tts.tts_to_file(text, speaker_id, "out.wav", profiler=prof)
+        prof.report()
+
+    Every call of a stage (enc_p, sdp, dp, generate_path, flow, dec) is recorded
+    with its wall time, the shapes it ran on (batch, T_text, T_frames, samples)
+    and its memory: allocated CUDA memory on GPU. On CPU the records have
+    `process_peak_rss_bytes`, the peak RSS of the process so far, which is not per
+    stage. With `reset_peak=True` they have the peak RSS during the stage instead
+    (it includes the memory of stages running in other threads at the same time):
+    every stage resets the RSS high-water mark of the whole process, which breaks
+    any other peak measurement of the process, so only use it in standalone runs
+    like benchmarks. Linux only, elsewhere it falls back to the peak so far. On GPU the stages are synchronized, which
+    makes the timings exact but the synthesis slower. `callback(record)` is
+    called for every finished stage.
+    """
+
+    def __init__(self, device=None, callback=None, reset_peak=False):
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() and torch.cuda.is_initialized() else "cpu"
+        self.cuda = "cuda" in str(device)
+        self.device = device
+        self.callback = callback
+        self.records = []
+        if self.cuda:
+            self.memory = "cuda_allocated"
+        elif reset_peak and reset_peak_rss():
+            self.memory = "peak_rss"
+        else:
+            self.memory = "process_peak_rss"
+        self.memory_key = "process_peak_rss_bytes" if self.memory == "process_peak_rss" else "peak_memory_bytes"
+
+    @contextmanager
+    def stage(self, name, **shapes):
+        record = {"stage": name, "shapes": dict(shapes)}
+        if self.cuda:
+            torch.cuda.synchronize(self.device)
+            torch.cuda.reset_peak_memory_stats(self.device)
+        elif self.memory == "peak_rss":
+            reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            # the stage can add shapes that are only known at its end
+            yield record["shapes"]
+        finally:
+            if self.cuda:
+                torch.cuda.synchronize(self.device)
+            record["wall_s"] = time.perf_counter() - start
+            if self.cuda:
+                record[self.memory_key] = torch.cuda.max_memory_allocated(self.device)
+            elif self.memory == "peak_rss":
+                record[self.memory_key] = peak_rss_since_reset()
+            else:
+                record[self.memory_key] = peak_rss_bytes()
+            self.records.append(record)
+            if self.callback is not None:
+                self.callback(record)
+
+    def report(self):
+        """
+        Dict with every recorded stage call in order and per-stage totals.
+        """
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record["stage"], {"calls": 0, "wall_s": 0., self.memory_key: 0})
+            total["calls"] += 1
+            total["wall_s"] += record["wall_s"]
+            total[self.memory_key] = max(total[self.memory_key], record[self.memory_key])
+        return {
+            "device": str(self.device),
+            "memory": self.memory,
+            "wall_s": sum(r["wall_s"] for r in self.records),
+            "stages": totals,
+            "records": list(self.records),
+        }
+
+    def reset(self):
+        self.records = []
+
+
+class _NullProfiler:
+    def stage(self, name, **shapes):
+        return nullcontext({})
+
+
+NULL_PROFILER = _NullProfiler()
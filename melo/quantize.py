@@ -0,0 +1,95 @@
+import torch
+from torch import nn
+from torch.nn import functional as F
+
+from melo import attentions
+
+QUANTIZE_MODES = ("int8", "int8_decoder")
+
+
+def quantize_linear_layers(module):
+    """
+    Dynamic int8 quantization of every nn.Linear in `module`: int8 weights, activations
+    quantized on the fly, CPU only. Returns the quantized module.
+    """
+    return torch.ao.quantization.quantize_dynamic(module, {nn.Linear}, dtype=torch.qint8)
+
+
+class QuantizedConv1d(nn.Module):
+    """
+    A Conv1d with stride 1 and one group (zero padding and dilation are fine) run as a
+    dynamically quantized int8 Linear over the windows of its input. `kernel_size`,
+    `padding` and `dilation` are the ones of the Conv1d.
+    """
+
+    def __init__(self, conv):
+        super().__init__()
+        assert conv.stride == (1,) and conv.groups == 1 and conv.padding_mode == "zeros"
+        assert not isinstance(conv.padding, str)
+        self.kernel_size = conv.kernel_size
+        self.padding = conv.padding
+        self.dilation = conv.dilation
+        linear = nn.Linear(conv.in_channels * conv.kernel_size[0], conv.out_channels, bias=conv.bias is not None)
+        with torch.no_grad():
+            # [out, in, k] -> [out, in * k], the layout of the unfolded input
+            linear.weight.copy_(conv.weight.reshape(conv.out_channels, -1))
+            if conv.bias is not None:
+                linear.bias.copy_(conv.bias)
+        self.linear = quantize_linear_layers(nn.Sequential(linear))[0]
+
+    def forward(self, x):
+        kernel_size, padding, dilation = self.kernel_size[0], self.padding[0], self.dilation[0]
+        if padding:
+            x = F.pad(x, (padding, padding))
+        # [b, c, t] -> [b, t - (k - 1) * d, c * k]
+        if kernel_size > 1:
+            span = (kernel_size - 1) * dilation + 1
+            x = x.unfold(2, span, 1)[..., ::dilation].transpose(1, 2).flatten(2)
+        else:
+            x = x.transpose(1, 2)
+        return self.linear(x).transpose(1, 2)
+
+
+def quantize_decoder(dec):
+    """
+    Replace the Conv1d layers of a `Generator` (conv_pre, the residual blocks and
+    conv_post) with `QuantizedConv1d`. The transposed upsampling convolutions stay in
+    float32, and so does the speaker projection, which is computed once per speaker.
+    The unfolded input of a layer is kernel_size times its size, so this costs memory
+    on long sentences; check speed and quality with `melo-bench quality`.
+    """
+    for module in list(dec.modules()):
+        for name, child in list(module.named_children()):
+            if type(child) is nn.Conv1d and name != "cond" and child.stride == (1,) and child.groups == 1:
+                setattr(module, name, QuantizedConv1d(child))
+    return dec
+
+
+def quantize_model(model, mode="int8", include_decoder=None):
+    """
+    Quantize a `SynthesizerTrn` in place for CPU inference: the projections of every
+    attention layer and the convolutions of every FFN, in the text encoder and the
+    transformer flows, become dynamically quantized int8 layers. The other
+    convolutions (duration predictors, WN layers) stay in float32, PyTorch has no
+    dynamic quantization for them. The decoder is only quantized with
+    `include_decoder` (by default for mode "int8_decoder"), see `quantize_decoder`.
+    """
+    if mode not in QUANTIZE_MODES:
+        raise ValueError(f"Unknown quantization '{mode}', expected one of {list(QUANTIZE_MODES)}")
+    if include_decoder is None:
+        include_decoder = mode == "int8_decoder"
+    # the query scale is folded into conv_q first
+    model.prepare_for_inference()
+    for module in list(model.modules()):
+        if isinstance(module, attentions.MultiHeadAttention):
+            names = ("conv_q", "conv_k", "conv_v", "conv_o")
+        elif isinstance(module, attentions.FFN):
+            names = ("conv_1", "conv_2")
+        else:
+            continue
+        for name in names:
+            setattr(module, name, QuantizedConv1d(getattr(module, name)))
+    if include_decoder:
+        quantize_decoder(model.dec)
+    model.clear_speaker_cache()
+    return model
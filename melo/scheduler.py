@@ -0,0 +1,165 @@
+import queue
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class _Job:
+    __slots__ = ("model", "features", "speaker_id", "params", "seed", "future")
+
+    def __init__(self, model, features, speaker_id, params, seed=None):
+        self.model = model
+        self.features = features
+        self.speaker_id = speaker_id
+        self.params = params
+        self.seed = seed
+        self.future = Future()
+
+
+class InferenceScheduler:
+    """
+    Dynamic batching of sentences coming from concurrent requests.
+
+    Every language gets its own queue and `num_workers` worker threads. A worker
+    takes the first queued sentence, keeps collecting for up to `max_wait_ms` (or
+    until `max_batch_size` sentences are queued) and runs them through
+    `TTS.infer_batch` as one padded batch. Sentences are only batched together when
+    they share the same sampling parameters; speakers and seeds may differ.
+    Every job runs on the model it was submitted with, so a worker never looks
+    up (and, with a `ModelRegistry`, reloads) a model itself.
+
+    Workers of a language share one model, which is safe as inference only reads
+    the weights. `num_threads` sets the torch intra-op thread count, which is
+    process wide: all workers share one intra-op pool of that size, so it caps the
+    cores the batches of the whole process use together. Load the text frontend of the models (`TTS.load_frontend`) before submitting from
+    several threads.
+    """
+
+    def __init__(self, models, max_batch_size=8, max_wait_ms=10, num_workers=1, num_threads=None):
+        self.models = models
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0., float(max_wait_ms)) / 1000.
+        self.num_workers = max(1, int(num_workers))
+        self.num_threads = num_threads
+        if num_threads:
+            torch.set_num_threads(int(num_threads))
+        self._queues = {}
+        self._workers = {}
+        self._lock = threading.Lock()
+
+    def _get_queue(self, language):
+        with self._lock:
+            q = self._queues.get(language)
+            if q is None:
+                q = self._queues[language] = queue.Queue()
+                self._workers[language] = []
+                for i in range(self.num_workers):
+                    worker = threading.Thread(
+                        target=self._worker, args=(language, q), name=f"tts-scheduler-{language}-{i}", daemon=True
+                    )
+                    self._workers[language].append(worker)
+                    worker.start()
+        return q
+
+    def submit(self, language, features, speaker_id, sdp_ratio=0.2, noise_scale=0.6, noise_scale_w=0.8, speed=1.0,
+               seed=None, model=None):
+        """
+        Queue one sentence (features from `TTS.text_to_features`), returns a Future of its waveform.
+        `model` is the `TTS` that computed the features, by default `models[language]`,
+        looked up in the calling thread.
+        """
+        if model is None:
+            model = self.models[language]
+        params = (sdp_ratio, noise_scale, noise_scale_w, speed)
+        job = _Job(model, features, speaker_id, params, seed)
+        self._get_queue(language).put(job)
+        return job.future
+
+    def synthesize(self, language, text, speaker_id, sdp_ratio=0.2, noise_scale=0.6, noise_scale_w=0.8, speed=1.0,
+                   seed=None, bert_provider=None):
+        """
+        Blocking helper: runs the text frontend in the calling thread (BERT batched
+        over the sentences), queues every sentence and returns the concatenated audio.
+        """
+        model = self.models[language]
+        texts = model.split_sentences_into_pieces(text, model.language, quiet=True)
+        futures = [
+            self.submit(language, features, speaker_id,
+                        sdp_ratio=sdp_ratio, noise_scale=noise_scale, noise_scale_w=noise_scale_w, speed=speed,
+                        seed=sentence_seed, model=model)
+            for features, sentence_seed in zip(model.texts_to_features(texts, bert_provider),
+                                               model.sentence_seeds(seed, len(texts)))
+        ]
+        audio_list = [f.result() for f in futures]
+        return model.audio_numpy_concat(audio_list, sr=model.hps.data.sampling_rate, speed=speed)
+
+    def queue_depth(self, language=None):
+        if language is not None:
+            q = self._queues.get(language)
+            return q.qsize() if q is not None else 0
+        return sum(q.qsize() for q in list(self._queues.values()))
+
+    def stop(self):
+        with self._lock:
+            for q in self._queues.values():
+                # every worker puts the sentinel back for the next one
+                q.put(None)
+            self._queues = {}
+            self._workers = {}
+
+    def _collect(self, q, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                job = q.get(timeout=timeout) if timeout > 0 else q.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                q.put(None)
+                break
+            batch.append(job)
+        return batch
+
+    def _worker(self, language, q):
+        while True:
+            job = q.get()
+            if job is None:
+                q.put(None)
+                break
+            batch = self._collect(q, job)
+            groups = {}
+            for job in batch:
+                # skip sentences whose request was cancelled while queued
+                if job.future.set_running_or_notify_cancel():
+                    # a model reloaded after an eviction is a different instance
+                    groups.setdefault((id(job.model), job.params), []).append(job)
+            for (_, params), jobs in groups.items():
+                self._run(language, jobs[0].model, params, jobs)
+
+    def _run(self, language, model, params, jobs):
+        sdp_ratio, noise_scale, noise_scale_w, speed = params
+        try:
+            audios = model.infer_batch(
+                [job.features for job in jobs],
+                [job.speaker_id for job in jobs],
+                sdp_ratio=sdp_ratio,
+                noise_scale=noise_scale,
+                noise_scale_w=noise_scale_w,
+                speed=speed,
+                seeds=[job.seed for job in jobs],
+            )
+        except Exception as e:
+            logger.exception(f"Batched inference failed for language={language}, batch_size={len(jobs)}")
+            for job in jobs:
+                job.future.set_exception(e)
+            return
+        logger.debug(f"Ran batch of {len(jobs)} sentences for language={language}")
+        for job, audio in zip(jobs, audios):
+            job.future.set_result(audio)
@@ -1,3 +1,6 @@
+import torch
+
+from . import bert_utils
 from .symbols import *
 
 
@@ -20,16 +23,194 @@ def cleaned_text_to_sequence(cleaned_text, tones, language, symbol_to_id=None):
     return phones, tones, lang_ids
 
 
-def get_bert(norm_text, word2ph, language, device):
-    from .chinese_bert import get_bert_feature as zh_bert
-    from .english_bert import get_bert_feature as en_bert
-    from .japanese_bert import get_bert_feature as jp_bert
-    from .chinese_mix import get_bert_feature as zh_mix_en_bert
-    from .spanish_bert import get_bert_feature as sp_bert
-    from .french_bert import get_bert_feature as fr_bert
-    from .korean import get_bert_feature as kr_bert
+# BERT model behind `get_full_bert` for every language
+BERT_MODEL_IDS = {
+    "ZH": 'hfl/chinese-roberta-wwm-ext-large',
+    "ZH_MIX_EN": 'bert-base-multilingual-uncased',
+    "EN": 'bert-base-uncased',
+    "JP": 'tohoku-nlp/bert-base-japanese-v3',
+    "KR": 'kykim/bert-kor-base',
+    "FR": 'dbmdz/bert-base-french-europeana-cased',
+    "SP": 'dccuchile/bert-base-spanish-wwm-uncased',
+    "ES": 'dccuchile/bert-base-spanish-wwm-uncased',
+}
+
+
+def get_full_bert(norm_text, word2ph, language, device, quantize=None):
+    return get_full_bert_batch([norm_text], [word2ph], language, device, quantize)[0]
+
+
+def get_full_bert_batch(norm_texts, word2phs, language, device, quantize=None):
+    # the Chinese tokenizers can produce more tokens than word2ph covers
+    strict = language not in ("ZH", "ZH_MIX_EN")
+    return bert_utils.get_bert_features(
+        norm_texts, word2phs, BERT_MODEL_IDS[language], device, strict=strict, quantize=quantize
+    )
+
+
+def bert_hidden_size(language):
+    # chinese-roberta-wwm-ext-large for ZH, BERT-base sized models otherwise
+    return 1024 if language == "ZH" else 768
+
+
+def get_stub_bert(norm_text, word2ph, language, device):
+    """
+    Zero features of the shape `get_full_bert` returns, without loading a BERT model.
+    """
+    return torch.zeros(bert_hidden_size(language), sum(word2ph))
+
+
+def load_bert(language, device, quantize=None):
+    """
+    Load the BERT model used by `get_full_bert` for `language` right away instead of on
+    the first request, e.g. before serving requests from several threads. Returns it.
+    """
+    return bert_utils.load_model(BERT_MODEL_IDS[language], device, quantize)[0]
+
+
+def unload_bert(language, quantize=None):
+    """
+    Drop the BERT model of `language`; `get_full_bert` loads it again when needed.
+    """
+    bert_utils.unload_model(BERT_MODEL_IDS[language], quantize)
+
+
+class BertProvider:
+    """
+    Source of the prosody features the acoustic model is conditioned on.
+    `provider(norm_text, word2ph, language, device)` returns a
+    (bert_hidden_size(language), sum(word2ph)) tensor, `batch` the same for a list
+    of texts; `load` and `unload` manage the models behind it, if any, and
+    `model_key` names the model `language` uses, equal for languages sharing one.
+    """
+
+    def __call__(self, norm_text, word2ph, language, device):
+        raise NotImplementedError
+
+    def batch(self, norm_texts, word2phs, language, device):
+        return [self(text, word2ph, language, device) for text, word2ph in zip(norm_texts, word2phs)]
+
+    def load(self, language, device):
+        return None
+
+    def unload(self, language):
+        pass
+
+    def model_key(self, language):
+        return None
+
+
+class FullBert(BertProvider):
+    """
+    The BERT model each language was trained with, with `quantize="int8"` a
+    dynamically quantized copy of it running on the CPU.
+    """
+
+    def __init__(self, quantize=None):
+        self.quantize = quantize
+
+    def __call__(self, norm_text, word2ph, language, device):
+        return get_full_bert(norm_text, word2ph, language, device, self.quantize)
+
+    def batch(self, norm_texts, word2phs, language, device):
+        return get_full_bert_batch(norm_texts, word2phs, language, device, self.quantize)
 
-    lang_bert_func_map = {"ZH": zh_bert, "EN": en_bert, "JP": jp_bert, 'ZH_MIX_EN': zh_mix_en_bert, 
-                          'FR': fr_bert, 'SP': sp_bert, 'ES': sp_bert, "KR": kr_bert}
-    bert = lang_bert_func_map[language](norm_text, word2ph, device)
-    return bert
+    def load(self, language, device):
+        return load_bert(language, device, self.quantize)
+
+    def unload(self, language):
+        unload_bert(language, self.quantize)
+
+    def model_key(self, language):
+        return (BERT_MODEL_IDS[language], self.quantize)
+
+
+class ZeroBert(BertProvider):
+    """
+    Zero features, no BERT model at all: the fastest frontend, with flatter prosody.
+    """
+
+    def __call__(self, norm_text, word2ph, language, device):
+        return get_stub_bert(norm_text, word2ph, language, device)
+
+
+class CachedBert(BertProvider):
+    """
+    Wraps another provider and keeps the features of recent texts in memory, for
+    prompts that come back often.
+    """
+
+    def __init__(self, provider, max_items=1024, max_bytes=None):
+        from melo.cache import LRUCache
+
+        self.provider = provider
+        self.cache = LRUCache(max_items, max_bytes, sizeof=lambda t: t.numel() * t.element_size())
+
+    def __call__(self, norm_text, word2ph, language, device):
+        key = (language, norm_text, tuple(word2ph))
+        bert = self.cache.get(key)
+        if bert is None:
+            bert = self.provider(norm_text, word2ph, language, device).cpu()
+            self.cache.put(key, bert)
+        return bert
+
+    def batch(self, norm_texts, word2phs, language, device):
+        keys = [(language, text, tuple(word2ph)) for text, word2ph in zip(norm_texts, word2phs)]
+        berts = [self.cache.get(key) for key in keys]
+        missing = [i for i, bert in enumerate(berts) if bert is None]
+        if missing:
+            computed = self.provider.batch(
+                [norm_texts[i] for i in missing], [word2phs[i] for i in missing], language, device
+            )
+            for i, bert in zip(missing, computed):
+                berts[i] = bert.cpu()
+                self.cache.put(keys[i], berts[i])
+        return berts
+
+    def load(self, language, device):
+        return self.provider.load(language, device)
+
+    def unload(self, language):
+        self.provider.unload(language)
+        self.cache.clear()
+
+    def model_key(self, language):
+        return self.provider.model_key(language)
+
+
+BERT_PROVIDERS = {
+    "bert": FullBert(),
+    "bert_int8": FullBert(quantize="int8"),
+    "zeros": ZeroBert(),
+}
+DEFAULT_BERT_PROVIDER = "bert"
+
+
+def register_bert_provider(name, provider):
+    """
+    Make `provider` (a `BertProvider`) selectable by `name`, e.g. a distilled encoder
+    that reproduces the BERT features with a smaller model, or a `CachedBert`.
+    """
+    BERT_PROVIDERS[name] = provider
+
+
+def get_bert_provider(name=None):
+    try:
+        return BERT_PROVIDERS[name or DEFAULT_BERT_PROVIDER]
+    except KeyError:
+        raise ValueError(f"Unknown BERT provider '{name}', expected one of {sorted(BERT_PROVIDERS)}") from None
+
+
+def get_bert(norm_text, word2ph, language, device, provider=None):
+    """
+    Prosody features of `norm_text`, one column per phone, from the provider
+    registered as `provider` (by default the full BERT model of the language).
+    """
+    return get_bert_provider(provider)(norm_text, word2ph, language, device)
+
+
+def get_bert_batch(norm_texts, word2phs, language, device, provider=None):
+    """
+    `get_bert` of several texts; the full BERT provider runs them as one batch.
+    """
+    return get_bert_provider(provider).batch(norm_texts, word2phs, language, device)
@@ -0,0 +1,144 @@
+import sys
+import threading
+
+import torch
+
+# model_id -> (model, tokenizer), shared by all languages using the same BERT
+_models = {}
+# one load lock per model, so that loading a model does not block the others
+_load_locks = {}
+_lock = threading.Lock()
+
+
+def resolve_device(device):
+    if (
+        sys.platform == "darwin"
+        and torch.backends.mps.is_available()
+        and device == "cpu"
+    ):
+        device = "mps"
+    if not device:
+        device = "cuda"
+    return device
+
+
+def _key(model_id, quantize=None):
+    return f"{model_id}:{quantize}" if quantize else model_id
+
+
+def load_model(model_id, device=None, quantize=None):
+    """
+    (model, tokenizer) of `model_id`, loaded on first use. `quantize="int8"` loads
+    a dynamically quantized copy of the model, on the CPU.
+    """
+    key = _key(model_id, quantize)
+    loaded = _models.get(key)
+    if loaded is not None:
+        return loaded
+    with _lock:
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+    # the lock keeps concurrent first requests from loading the model twice
+    with load_lock:
+        loaded = _models.get(key)
+        if loaded is None:
+            from transformers import AutoTokenizer, AutoModelForMaskedLM
+
+            tokenizer = AutoTokenizer.from_pretrained(model_id)
+            if quantize:
+                from melo.quantize import quantize_linear_layers
+
+                model = quantize_linear_layers(AutoModelForMaskedLM.from_pretrained(model_id).eval())
+            else:
+                model = AutoModelForMaskedLM.from_pretrained(model_id).to(resolve_device(device))
+            loaded = _models[key] = (model, tokenizer)
+        return loaded
+
+
+def unload_model(model_id, quantize=None):
+    with _lock:
+        _models.pop(_key(model_id, quantize), None)
+
+
+def share_model(model_id, device=None):
+    """
+    Load `model_id` and move its weights to shared memory. Returns (config, tensors),
+    from which `install_shared_model` builds the same model in another process
+    without copying the weights.
+    """
+    model, _ = load_model(model_id, device)
+    model.share_memory()
+    # the non-persistent buffers (e.g. position_ids) are not part of the state dict
+    tensors = dict(model.named_buffers())
+    tensors.update(model.state_dict())
+    return model.config, tensors
+
+
+def install_shared_model(model_id, config, tensors):
+    """
+    Make `load_model(model_id)` return a model whose weights are the shared `tensors`
+    of `share_model`; only the tokenizer is loaded.
+    """
+    from transformers import AutoTokenizer, AutoModelForMaskedLM
+
+    # build the model without allocating weights, then point it at the shared tensors
+    with torch.device("meta"):
+        model = AutoModelForMaskedLM.from_config(config)
+    model.load_state_dict(tensors, strict=False, assign=True)
+    for name, buffer in list(model.named_buffers()):
+        if buffer.is_meta:
+            module_name, _, buffer_name = name.rpartition(".")
+            model.get_submodule(module_name)._buffers[buffer_name] = tensors[name]
+    model.tie_weights()
+    missing = [name for name, param in model.named_parameters() if param.is_meta]
+    if missing:
+        raise RuntimeError(f"Shared weights of {model_id} are missing {missing}")
+    loaded = (model.eval(), AutoTokenizer.from_pretrained(model_id))
+    with _lock:
+        _models[_key(model_id)] = loaded
+    return loaded
+
+
+def expand_to_phones(word_features, word2ph):
+    """
+    Repeat the (n_tokens, hidden) features of every token word2ph[i] times, on the
+    device they are on. Returns (hidden, sum(word2ph)).
+    """
+    repeats = torch.as_tensor(word2ph, dtype=torch.long, device=word_features.device)
+    return torch.repeat_interleave(word_features[:len(word2ph)], repeats, dim=0).T
+
+
+def get_bert_feature(text, word2ph, model_id, device=None, strict=True, quantize=None):
+    """
+    Phone level features of `text` from the third to last hidden layer of `model_id`.
+    They stay on the device of the BERT model, `device` only matters for the first
+    call that loads it. `strict` checks that word2ph has one entry per token.
+    `quantize`, see `load_model`.
+    """
+    return get_bert_features([text], [word2ph], model_id, device, strict, quantize=quantize)[0]
+
+
+def get_bert_features(texts, word2phs, model_id, device=None, strict=True, max_batch_size=16, quantize=None):
+    """
+    `get_bert_feature` of several texts, run as padded batches of up to
+    `max_batch_size` texts of similar length through one forward pass each.
+    """
+    model, tokenizer = load_model(model_id, device, quantize)
+    features = [None] * len(texts)
+    # similar lengths in one batch keep the padding small
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    for start in range(0, len(order), max_batch_size):
+        idx = order[start:start + max_batch_size]
+        with torch.no_grad():
+            inputs = tokenizer([texts[i] for i in idx], padding=True, return_tensors="pt")
+            for key in inputs:
+                inputs[key] = inputs[key].to(model.device)
+            res = model(**inputs, output_hidden_states=True)
+            res = res["hidden_states"][-3]
+        # drop the padding of every text before expanding its tokens to phones
+        mask = inputs["attention_mask"].bool()
+        for row, i in enumerate(idx):
+            tokens = res[row][mask[row]]
+            if strict:
+                assert tokens.size(0) == len(word2phs[i]), f"{tokens.size(0)}/{len(word2phs[i])}"
+            features[i] = expand_to_phones(tokens, word2phs[i])
+    return features
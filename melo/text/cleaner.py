@@ -6,6 +6,14 @@ language_module_map = {"ZH": chinese, "JP": japanese, "EN": english, 'ZH_MIX_EN'
                     'FR': french, 'SP': spanish, 'ES': spanish}
 
 
+def text_normalize(text, language):
+    return language_module_map[language].text_normalize(text)
+
+
+def g2p(norm_text, language):
+    return language_module_map[language].g2p(norm_text)
+
+
 def clean_text(text, language):
     language_module = language_module_map[language]
     norm_text = language_module.text_normalize(text)
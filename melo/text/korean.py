@@ -1,6 +1,7 @@
 # Convert Japanese text to phonemes which is
 # compatible with Julius https://github.com/julius-speech/segmentation-kit
 import re
+import threading
 import unicodedata
 
 from transformers import AutoTokenizer
@@ -41,6 +42,7 @@ def normalize_english(text):
 
 
 g2p_kr = None
+_g2p_lock = threading.Lock()
 def korean_text_to_phonemes(text, character: str = "hangeul") -> str:
     """
 
@@ -53,10 +55,11 @@ def korean_text_to_phonemes(text, character: str = "hangeul") -> str:
 
     """
     global g2p_kr  # pylint: disable=global-statement
-    if g2p_kr is None:
-        from g2pkk import G2p
+    with _g2p_lock:
+        if g2p_kr is None:
+            from g2pkk import G2p
 
-        g2p_kr = G2p()
+            g2p_kr = G2p()
 
     if character == "english":
         from anyascii import anyascii
@@ -3,15 +3,17 @@ import glob
 import argparse
 import logging
 import json
+import hashlib
 import subprocess
 import numpy as np
 from scipy.io.wavfile import read
 import torch
 import torchaudio
 import librosa
-from melo.text import cleaned_text_to_sequence, get_bert
-from melo.text.cleaner import clean_text
+from melo.text import cleaned_text_to_sequence, get_bert_batch, DEFAULT_BERT_PROVIDER
+from melo.text import cleaner
 from melo import commons
+from melo import metrics
 
 MATPLOTLIB_FLAG = False
 
@@ -19,24 +21,69 @@ logger = logging.getLogger(__name__)
 
 
 
-def get_text_for_tts_infer(text, language_str, hps, device, symbol_to_id=None):
-    norm_text, phone, tone, word2ph = clean_text(text, language_str)
-    phone, tone, language = cleaned_text_to_sequence(phone, tone, language_str, symbol_to_id)
+def get_text_for_tts_infer(text, language_str, hps, device, symbol_to_id=None, cache=None, cache_id=None,
+                           bert_provider=None):
+    return get_texts_for_tts_infer(
+        [text], language_str, hps, device, symbol_to_id, cache, cache_id, bert_provider
+    )[0]
 
-    if hps.data.add_blank:
-        phone = commons.intersperse(phone, 0)
-        tone = commons.intersperse(tone, 0)
-        language = commons.intersperse(language, 0)
-        for i in range(len(word2ph)):
-            word2ph[i] = word2ph[i] * 2
-        word2ph[0] += 1
+
+def get_texts_for_tts_infer(texts, language_str, hps, device, symbol_to_id=None, cache=None, cache_id=None,
+                            bert_provider=None):
+    """
+    `get_text_for_tts_infer` of several sentences: the BERT features of all the
+    sentences that are not cached are computed in one batch.
+    """
+    # `bert_provider` (see `melo.text.BERT_PROVIDERS`) overrides the one of the config
+    bert_provider = bert_provider or getattr(hps.data, "bert_provider", None) or DEFAULT_BERT_PROVIDER
+    results = [None] * len(texts)
+    pending = []
+    for i, text in enumerate(texts):
+        with metrics.timed("text_normalization", language_str):
+            norm_text = cleaner.text_normalize(text, language_str)
+        cache_key = None
+        if cache is not None:
+            # `cache_id` identifies the symbol table / text settings of the model
+            cache_key = (language_str, norm_text, cache_id, bert_provider)
+            features = cache.get(cache_key)
+            if features is not None:
+                results[i] = features
+                continue
+        with metrics.timed("g2p", language_str):
+            phone, tone, word2ph = cleaner.g2p(norm_text, language_str)
+        phone, tone, language = cleaned_text_to_sequence(phone, tone, language_str, symbol_to_id)
+
+        if hps.data.add_blank:
+            phone = commons.intersperse(phone, 0)
+            tone = commons.intersperse(tone, 0)
+            language = commons.intersperse(language, 0)
+            for j in range(len(word2ph)):
+                word2ph[j] = word2ph[j] * 2
+            word2ph[0] += 1
+        pending.append((i, norm_text, phone, tone, language, word2ph, cache_key))
+    if not pending:
+        return results
 
     if getattr(hps.data, "disable_bert", False):
+        berts = [None] * len(pending)
+    else:
+        with metrics.timed("bert", language_str):
+            berts = get_bert_batch(
+                [p[1] for p in pending], [p[5] for p in pending], language_str, device, bert_provider
+            )
+    for (i, _, phone, tone, language, _, cache_key), bert in zip(pending, berts):
+        features = _text_features(bert, phone, tone, language, language_str)
+        if cache_key is not None:
+            cache.put(cache_key, features)
+        results[i] = features
+    return results
+
+
+def _text_features(bert, phone, tone, language, language_str):
+    if bert is None:
         bert = torch.zeros(1024, len(phone))
         ja_bert = torch.zeros(768, len(phone))
     else:
-        bert = get_bert(norm_text, word2ph, language_str, device)
-        del word2ph
         assert bert.shape[-1] == len(phone), phone
 
         if language_str == "ZH":
@@ -57,6 +104,28 @@ def get_text_for_tts_infer(text, language_str, hps, device, symbol_to_id=None):
     language = torch.LongTensor(language)
     return bert, ja_bert, phone, tone, language
 
+
+def state_dict_checksum(state_dict):
+    """
+    Cheap checksum of model weights: names, shapes and per-tensor sums instead of
+    hashing every byte, so it stays fast for large checkpoints.
+    """
+    parts = []
+    for name in sorted(state_dict.keys()):
+        t = state_dict[name]
+        if torch.is_tensor(t):
+            t64 = t.detach().double()
+            parts.append((name, list(t.shape), float(t64.sum()), float(t64.abs().sum())))
+    return fingerprint(parts)
+
+
+def fingerprint(*parts):
+    """
+    Short stable hash of json-serializable values, used to identify models in cache keys.
+    """
+    data = json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(data).hexdigest()[:16]
+
 def load_checkpoint(checkpoint_path, model, optimizer=None, skip_optimizer=False):
     assert os.path.isfile(checkpoint_path)
     checkpoint_dict = torch.load(checkpoint_path, map_location="cpu")
@@ -137,6 +206,19 @@ def save_checkpoint(model, optimizer, learning_rate, iteration, checkpoint_path)
     )
 
 
+def save_inference_checkpoint(model, checkpoint_path):
+    """
+    Save the weights of a model turned into its inference build by
+    `SynthesizerTrn.prepare_for_inference`, without optimizer state. `TTS` loads
+    such a checkpoint like a training one.
+    """
+    if hasattr(model, "module"):
+        model = model.module
+    assert model.inference_build, "call model.prepare_for_inference() first"
+    logger.info("Saving inference checkpoint to {}".format(checkpoint_path))
+    torch.save({"model": model.state_dict(), "inference": True}, checkpoint_path)
+
+
 def summarize(
     writer,
     global_step,
@@ -422,3 +504,6 @@ class HParams:
 
     def __repr__(self):
         return self.__dict__.__repr__()
+
+    def to_dict(self):
+        return {k: v.to_dict() if isinstance(v, HParams) else v for k, v in self.items()}
@@ -0,0 +1,267 @@
+import sys
+import types
+import queue
+import logging
+import itertools
+import threading
+import traceback
+from contextlib import contextmanager
+from concurrent.futures import Future
+
+import torch
+import torch.multiprocessing as mp
+
+logger = logging.getLogger(__name__)
+
+
+def parse_affinity(spec, languages, default_workers=1):
+    """
+    Number of worker processes per language from a spec like "EN:3,ZH:2".
+    Languages missing from the spec get `default_workers`.
+    """
+    counts = {lang: default_workers for lang in languages}
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        lang, _, n = item.partition(":")
+        lang = lang.strip()
+        if lang not in counts:
+            raise ValueError(f"Worker affinity for '{lang}', which is not one of the served languages {languages}")
+        counts[lang] = int(n)
+    return counts
+
+
+@contextmanager
+def _without_main():
+    # spawned children re-run the parent's __main__ module (e.g. melo/app.py, which
+    # loads every model); the workers only need importable modules, so hide it
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+
+def _worker_main(worker_id, language, state_dict, bert, hps, inference, backend, device, num_threads,
+                 feature_cache_size, jobs, results):
+    # imported here so that the parent does not need the text frontend of the workers
+    from melo.api import TTS
+    from melo.cache import FeatureCache
+    from melo.text import bert_utils
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    # build the model without allocating weights, then point it at the shared tensors
+    with torch.device("meta"):
+        model = TTS.build_model(hps, inference=inference)
+    model.load_state_dict(state_dict, assign=True)
+    feature_cache = FeatureCache(feature_cache_size) if feature_cache_size > 0 else None
+    tts = TTS.from_model(model, hps, language, device=device, feature_cache=feature_cache, backend=backend)
+    if bert is not None:
+        bert_utils.install_shared_model(*bert)
+    tts.load_frontend()
+    tts.warmup()
+    results.put(("ready", worker_id, None))
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, method, args, kwargs = job
+        results.put(("started", job_id, worker_id))
+        try:
+            result = getattr(tts, method)(*args, **kwargs)
+        except Exception as e:
+            # exceptions of the frontend libraries are not always picklable
+            result = RuntimeError(f"{type(e).__name__}: {e}\n{traceback.format_exc()}")
+            results.put(("error", job_id, result))
+            continue
+        results.put(("done", job_id, result))
+
+
+class _Job:
+    __slots__ = ("language", "message", "future", "worker_id")
+
+    def __init__(self, language, message):
+        self.language = language
+        self.message = message
+        self.future = Future()
+        self.worker_id = None
+
+
+class WorkerPool:
+    """
+    Runs `TTS` methods in worker processes, so that the GIL-bound text frontends
+    (jieba, g2p_en, MeCab, gruut, ...) of concurrent requests use several cores.
+
+    The acoustic models and the BERT models of the default provider are loaded once
+    in the parent and moved to shared memory; every worker wraps the same weights
+    with `TTS.from_model` and only loads the tokenizers. `workers` maps a language to its number of
+    worker processes. Every worker has its own job queue and a job goes to the
+    worker of its language with the fewest outstanding jobs. A worker that dies
+    after starting up is restarted: its current job fails, its queued jobs are
+    sent to the other workers.
+    """
+
+    def __init__(self, models, workers, num_threads=None, feature_cache_size=256):
+        self.models = models
+        self.num_threads = num_threads
+        self.feature_cache_size = feature_cache_size
+        self._ctx = mp.get_context("spawn")
+        self._results = self._ctx.Queue()
+        self._state_dicts = {}
+        self._berts = {}
+        self._workers = {}
+        self._jobs = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._stopped = False
+
+        for language, model in models.items():
+            if getattr(model, "quantize", None):
+                raise ValueError(f"The quantized {language} model cannot be shared with worker processes")
+            model.model.share_memory()
+            self._state_dicts[language] = model.model.state_dict()
+            self._berts[language] = self._share_bert(model)
+        worker_ids = itertools.count()
+        for language, n in workers.items():
+            for _ in range(n):
+                self._start_worker(next(worker_ids), language)
+        self._collector = threading.Thread(target=self._collect, name="tts-worker-pool", daemon=True)
+        self._collector.start()
+
+    @staticmethod
+    def _share_bert(tts):
+        """
+        (model_id, config, shared tensors) of the BERT model `tts` loads, None if its
+        provider is not the plain `FullBert`; other providers load their own models
+        in every worker.
+        """
+        from melo.text import BERT_MODEL_IDS, FullBert, get_bert_provider, bert_utils
+
+        provider = get_bert_provider(tts.bert_provider)
+        if getattr(tts.hps.data, "disable_bert", False) or not isinstance(provider, FullBert) or provider.quantize:
+            return None
+        model_id = BERT_MODEL_IDS[tts.language]
+        return (model_id,) + bert_utils.share_model(model_id, tts.device)
+
+    def _start_worker(self, worker_id, language):
+        tts = self.models[language]
+        jobs = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, language, self._state_dicts[language], self._berts[language], tts.hps, tts.model.inference_build, tts.backend,
+                  tts.device, self.num_threads, self.feature_cache_size, jobs, self._results),
+            name=f"tts-worker-{language}-{worker_id}",
+            daemon=True,
+        )
+        with _without_main():
+            process.start()
+        # language, process, job queue, ids of queued or running jobs, started up
+        self._workers[worker_id] = [language, process, jobs, set(), False]
+        logger.info(f"Started worker process {worker_id} for language={language}, pid={process.pid}")
+
+    def _dispatch(self, job_id, job):
+        # caller holds self._lock
+        candidates = [(len(w[3]), wid) for wid, w in self._workers.items() if w[0] == job.language]
+        if not candidates:
+            job.future.set_exception(RuntimeError(f"No worker processes left for language '{job.language}'"))
+            del self._jobs[job_id]
+            return
+        _, worker_id = min(candidates)
+        worker = self._workers[worker_id]
+        job.worker_id = worker_id
+        worker[3].add(job_id)
+        worker[2].put((job_id,) + job.message)
+
+    def submit(self, language, method, *args, **kwargs):
+        """
+        Run `TTS.<method>(*args, **kwargs)` of `language` in a worker, returns a Future of the result.
+        """
+        if language not in self._state_dicts:
+            raise KeyError(f"No worker processes for language '{language}'")
+        job = _Job(language, (method, args, kwargs))
+        with self._lock:
+            job_id = next(self._ids)
+            self._jobs[job_id] = job
+            self._dispatch(job_id, job)
+        return job.future
+
+    def synthesize(self, language, text, speaker_id, **kwargs):
+        """
+        Blocking helper returning the audio of `text`, see `TTS.tts_to_file`.
+        """
+        return self.submit(language, "tts_to_file", text, speaker_id, None, quiet=True, **kwargs).result()
+
+    def is_ready(self):
+        """
+        Whether every language has a worker that loaded and warmed up its model.
+        """
+        with self._lock:
+            ready = {language for language, _, _, _, started in self._workers.values() if started}
+        return ready >= set(self._state_dicts)
+
+    def queue_depth(self, language=None):
+        with self._lock:
+            return sum(
+                len(job_ids) for lang, _, _, job_ids, _ in self._workers.values()
+                if language is None or lang == language
+            )
+
+    def stop(self):
+        self._stopped = True
+        with self._lock:
+            workers = list(self._workers.values())
+        for _, _, jobs, _, _ in workers:
+            jobs.put(None)
+        for _, process, _, _, _ in workers:
+            process.join(timeout=5)
+
+    def _collect(self):
+        while not self._stopped:
+            self._check_workers()
+            try:
+                kind, key, value = self._results.get(timeout=1.)
+            except queue.Empty:
+                continue
+            with self._lock:
+                if kind == "ready":
+                    if key in self._workers:
+                        self._workers[key][4] = True
+                    logger.info(f"Worker process {key} is ready")
+                    continue
+                if kind == "started":
+                    job = self._jobs.get(key)
+                    if job is not None:
+                        job.future.set_running_or_notify_cancel()
+                    continue
+                job = self._jobs.pop(key, None)
+                if job is None:
+                    continue
+                if job.worker_id in self._workers:
+                    self._workers[job.worker_id][3].discard(key)
+            if job.future.cancelled():
+                continue
+            if kind == "error":
+                job.future.set_exception(value)
+            else:
+                job.future.set_result(value)
+
+    def _check_workers(self):
+        with self._lock:
+            for worker_id, (language, process, _, job_ids, ready) in list(self._workers.items()):
+                if process.is_alive() or self._stopped:
+                    continue
+                logger.error(f"Worker process {worker_id} for language={language} exited with code {process.exitcode}")
+                del self._workers[worker_id]
+                if ready:
+                    self._start_worker(worker_id, language)
+                # failed while loading otherwise, restarting would fail the same way
+                for job_id in sorted(job_ids):
+                    job = self._jobs[job_id]
+                    if job.future.running():
+                        job.future.set_exception(RuntimeError(f"Worker process {worker_id} died while running the job"))
+                        del self._jobs[job_id]
+                    else:
+                        self._dispatch(job_id, job)
@@ -0,0 +1,26 @@
+import pytest
+import torch
+
+from melo.api import TTS
+
+
+@pytest.fixture(scope="session")
+def tts():
+    # random weights and zero BERT features: nothing is downloaded
+    return TTS.from_config("EN", device="cpu", seed=0, bert_provider="zeros")
+
+
+def make_features(tts, n_phones, seed=0):
+    """
+    Random (bert, ja_bert, phones, tones, lang_ids) of `n_phones` phones, in the
+    layout of `TTS.text_to_features`.
+    """
+    g = torch.Generator().manual_seed(seed)
+    enc_p = tts.model.enc_p
+    return (
+        torch.zeros(enc_p.bert_proj.in_channels, n_phones),
+        torch.zeros(enc_p.ja_bert_proj.in_channels, n_phones),
+        torch.randint(1, len(tts.hps.symbols), (n_phones,), generator=g),
+        torch.randint(0, tts.hps.num_tones, (n_phones,), generator=g),
+        torch.randint(0, tts.hps.num_languages, (n_phones,), generator=g),
+    )
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from melo.api import TTS
+
+SR = 44100
+
+
+def reference_concat(segment_data_list, sr, speed=1.):
+    # the list based implementation audio_numpy_concat replaced
+    audio_segments = []
+    for segment_data in segment_data_list:
+        audio_segments += segment_data.reshape(-1).tolist()
+        audio_segments += [0] * int((sr * 0.05) / speed)
+    audio_segments = np.array(audio_segments).astype(np.float32)
+    return audio_segments
+
+
+def random_segments(lengths, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.standard_normal(n).astype(np.float32) for n in lengths]
+
+
+@pytest.mark.parametrize("speed", [0.7, 1.0, 1.3])
+@pytest.mark.parametrize("lengths", [[1000], [5000, 0, 123, 44100], [7, 3]])
+def test_matches_reference(lengths, speed):
+    segments = random_segments(lengths)
+    audio = TTS.audio_numpy_concat(segments, sr=SR, speed=speed)
+    expected = reference_concat(segments, sr=SR, speed=speed)
+    assert audio.dtype == np.float32
+    np.testing.assert_array_equal(audio, expected)
+
+
+def test_matches_reference_2d_segments():
+    segments = [s.reshape(1, 1, -1) for s in random_segments([300, 900])]
+    np.testing.assert_array_equal(TTS.audio_numpy_concat(segments, sr=SR), reference_concat(segments, sr=SR))
+
+
+@pytest.mark.parametrize("crossfade", ["linear", "equal_power"])
+def test_crossfade_single_segment(crossfade):
+    segment = random_segments([2000])[0]
+    # nothing to crossfade into without a gap
+    audio = TTS.audio_numpy_concat([segment], sr=SR, gap=0, crossfade=crossfade)
+    np.testing.assert_array_equal(audio, segment)
+    # with a gap, the edges are faded and the silence follows
+    audio = TTS.audio_numpy_concat([segment], sr=SR, gap=0.05, crossfade=crossfade)
+    fade_len = int(SR * 0.01)
+    assert len(audio) == len(segment) + int(SR * 0.05)
+    np.testing.assert_array_equal(audio[fade_len:len(segment) - fade_len], segment[fade_len:-fade_len])
+    assert abs(audio[0]) < abs(segment[0]) or segment[0] == 0
+    assert not audio[len(segment):].any()
+
+
+@pytest.mark.parametrize("crossfade", ["linear", "equal_power"])
+def test_crossfade_segment_shorter_than_fade(crossfade):
+    fade_len = int(SR * 0.01)
+    segments = [np.ones(3000, np.float32), np.ones(fade_len // 4, np.float32), np.ones(3000, np.float32)]
+    # the overlap of each join is capped by the shorter segment
+    overlaps = [min(fade_len, 3000, fade_len // 4)] * 2
+    audio = TTS.audio_numpy_concat(segments, sr=SR, gap=0, crossfade=crossfade)
+    assert len(audio) == sum(len(s) for s in segments) - sum(overlaps)
+    assert np.isfinite(audio).all()
+    # with a gap, a short segment is faded over half its length at most
+    audio = TTS.audio_numpy_concat(segments, sr=SR, gap=0.05, crossfade=crossfade)
+    assert len(audio) == sum(len(s) for s in segments) + 3 * int(SR * 0.05)
+    assert np.isfinite(audio).all()
+
+
+def test_linear_crossfade_keeps_constant_signal():
+    segments = [np.ones(3000, np.float32), np.ones(2000, np.float32)]
+    audio = TTS.audio_numpy_concat(segments, sr=SR, gap=0, crossfade="linear")
+    np.testing.assert_allclose(audio, 1., rtol=0, atol=1e-6)
+
+
+def test_crossfade_of_one_sample_segments():
+    segments = [np.ones(1, np.float32)] * 3
+    audio = TTS.audio_numpy_concat(segments, sr=SR, gap=0, crossfade="linear")
+    assert len(audio) == 1
+    audio = TTS.audio_numpy_concat(segments, sr=SR, gap=0.05, crossfade="linear")
+    assert len(audio) == 3 * (1 + int(SR * 0.05))
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+import torch
+
+from conftest import make_features
+
+
+def infer_alone(tts, features, speaker_id, **kwargs):
+    bert, ja_bert, phones, tones, lang_ids = features
+    with torch.no_grad():
+        o = tts.model.infer(
+            phones[None], torch.LongTensor([phones.size(0)]), torch.LongTensor([speaker_id]), tones[None],
+            lang_ids[None], bert[None], ja_bert[None], **kwargs
+        )[0]
+    return o[0, 0].numpy()
+
+
+@pytest.mark.parametrize("batch_size", [2, 4])
+def test_batch_matches_sentences(tts, batch_size):
+    # no sampling noise, so every sentence has one expected output
+    kwargs = dict(sdp_ratio=0.2, noise_scale=0., noise_scale_w=0.)
+    lengths = [12, 70, 33, 101, 48][:batch_size + 1]
+    features = [make_features(tts, n, seed=i) for i, n in enumerate(lengths)]
+    batched = tts.infer_batch(features, 0, speed=1.0, **kwargs)
+    assert len(batched) == len(features)
+    for feature, audio in zip(features, batched):
+        alone = infer_alone(tts, feature, 0, length_scale=1.0, **kwargs)
+        assert audio.shape == alone.shape
+        np.testing.assert_allclose(audio, alone, rtol=0, atol=1e-5)
+
+
+def test_infer_by_length_keeps_order(tts):
+    kwargs = dict(sdp_ratio=0.2, noise_scale=0., noise_scale_w=0.)
+    features = [make_features(tts, n, seed=i) for i, n in enumerate([80, 15, 45, 15, 120])]
+    batched = tts._infer_by_length(features, 0, 2, [None] * len(features), **kwargs)
+    for feature, audio in zip(features, batched):
+        np.testing.assert_allclose(audio, infer_alone(tts, feature, 0, **kwargs), rtol=0, atol=1e-5)
@@ -0,0 +1,64 @@
+import os
+import time
+
+import torch
+
+from melo.cache import FeatureCache
+
+
+def features(n_phones):
+    return (
+        torch.zeros(1024, n_phones), torch.zeros(768, n_phones), torch.ones(n_phones, dtype=torch.long),
+        torch.zeros(n_phones, dtype=torch.long), torch.zeros(n_phones, dtype=torch.long),
+    )
+
+
+def dir_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def test_disk_tier_evicts(tmp_path):
+    # one entry is about 180 kB on disk, the limit holds three of them
+    one = FeatureCache(max_items=1, cache_dir=str(tmp_path / "probe"))
+    one.put(("EN", "probe", "id"), features(25))
+    entry_bytes = dir_bytes(str(tmp_path / "probe"))
+
+    cache_dir = str(tmp_path / "features")
+    cache = FeatureCache(max_items=1, cache_dir=cache_dir, max_bytes=3 * entry_bytes)
+    keys = [("EN", f"sentence {i}", "id") for i in range(10)]
+    for key in keys:
+        cache.put(key, features(25))
+        # distinct modification times for the LRU order
+        time.sleep(0.01)
+
+    assert len(cache.disk) == 3
+    assert dir_bytes(cache_dir) <= 3 * entry_bytes
+    # the most recent entries are kept, the oldest are gone from both tiers
+    assert cache.get(keys[-1]) is not None
+    assert cache.get(keys[0]) is None
+
+
+def test_disk_tier_serves_evicted_memory_entries(tmp_path):
+    cache = FeatureCache(max_items=1, cache_dir=str(tmp_path))
+    cache.put(("EN", "a", "id"), features(10))
+    cache.put(("EN", "b", "id"), features(10))
+    assert ("EN", "a", "id") not in cache.memory
+    bert = cache.get(("EN", "a", "id"))[0]
+    assert bert.shape == (1024, 10)
+
+
+def test_disk_tier_resumes_from_existing_files(tmp_path):
+    cache_dir = str(tmp_path / "features")
+    cache = FeatureCache(max_items=1, cache_dir=cache_dir)
+    keys = [("EN", f"sentence {i}", "id") for i in range(4)]
+    for key in keys:
+        cache.put(key, features(25))
+        time.sleep(0.01)
+    entry_bytes = dir_bytes(cache_dir) // len(keys)
+
+    # a new process finds the files and trims them to its smaller limit, oldest first
+    reopened = FeatureCache(max_items=1, cache_dir=cache_dir, max_bytes=2 * entry_bytes)
+    assert len(reopened.disk) == 2
+    assert reopened.disk.stats()["bytes"] == dir_bytes(cache_dir)
+    assert reopened.get(keys[0]) is None
+    assert reopened.get(keys[-1]) is not None
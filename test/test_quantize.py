@@ -0,0 +1,46 @@
+import pytest
+import torch
+from torch import nn
+
+from melo.models import Generator
+from melo.quantize import QuantizedConv1d, quantize_decoder
+
+
+@pytest.mark.parametrize("kernel_size,dilation,padding", [(1, 1, 0), (3, 1, 0), (7, 1, 3), (3, 5, 5), (11, 3, 15)])
+def test_quantized_conv1d_matches_conv1d(kernel_size, dilation, padding):
+    torch.manual_seed(0)
+    conv = nn.Conv1d(32, 48, kernel_size, dilation=dilation, padding=padding).eval()
+    x = torch.randn(2, 32, 200)
+    with torch.no_grad():
+        expected = conv(x)
+        out = QuantizedConv1d(conv)(x)
+    assert out.shape == expected.shape
+    # int8 weights and activations, a few percent of error
+    assert (out - expected).norm() / expected.norm() < 0.05
+
+
+def small_generator():
+    torch.manual_seed(0)
+    dec = Generator(64, "1", [3, 7, 11], [[1, 3, 5]] * 3, [4, 4], 64, [8, 8]).eval()
+    dec.remove_weight_norm()
+    return dec
+
+
+def test_quantized_decoder_keeps_receptive_field():
+    dec = small_generator()
+    receptive_field = dec.receptive_field()
+    quantize_decoder(dec)
+    assert isinstance(dec.conv_pre, QuantizedConv1d) and isinstance(dec.conv_post, QuantizedConv1d)
+    assert not any(type(m) is nn.Conv1d for m in dec.resblocks.modules())
+    assert dec.receptive_field() == receptive_field
+
+
+def test_quantized_decoder_streams_like_forward():
+    dec = quantize_decoder(small_generator())
+    x = torch.randn(1, 64, 60)
+    with torch.no_grad():
+        expected = dec(x)
+        streamed = torch.cat(list(dec.forward_stream(x, chunk_size=16)), dim=2)
+    assert streamed.shape == expected.shape
+    # activations are quantized per call, so the windows differ from one full pass by rounding only
+    assert (streamed - expected).norm() / expected.norm() < 0.05
@@ -0,0 +1,40 @@
+import numpy as np
+
+from melo.scheduler import InferenceScheduler
+
+
+class FakeModel:
+    def __init__(self, value):
+        self.value = value
+        self.batch_sizes = []
+
+    def infer_batch(self, features, speaker_ids, seeds=None, **kwargs):
+        self.batch_sizes.append(len(features))
+        return [np.full(n, self.value, dtype=np.float32) for n in features]
+
+
+class CountingModels(dict):
+    def __init__(self, models):
+        super().__init__(models)
+        self.lookups = 0
+
+    def __getitem__(self, language):
+        self.lookups += 1
+        return super().__getitem__(language)
+
+
+def test_jobs_run_on_the_model_they_were_submitted_with():
+    old, new = FakeModel(1.), FakeModel(2.)
+    models = CountingModels({"EN": new})
+    scheduler = InferenceScheduler(models, max_batch_size=4, max_wait_ms=50)
+    try:
+        # e.g. the registry reloaded the model between the two requests
+        futures = [scheduler.submit("EN", 3, 0, model=old), scheduler.submit("EN", 5, 0, model=new)]
+        audios = [f.result(timeout=10) for f in futures]
+    finally:
+        scheduler.stop()
+    assert audios[0].tolist() == [1.] * 3
+    assert audios[1].tolist() == [2.] * 5
+    assert old.batch_sizes == [1] and new.batch_sizes == [1]
+    # the workers never looked the model up themselves
+    assert models.lookups == 0
@@ -0,0 +1,27 @@
+import numpy as np
+
+from conftest import make_features
+
+
+def test_same_seed_same_audio(tts):
+    features = [make_features(tts, 40, seed=1)]
+    first = tts.infer_batch(features, 0, seeds=[123])[0]
+    second = tts.infer_batch(features, 0, seeds=[123])[0]
+    np.testing.assert_array_equal(first, second)
+
+
+def test_other_seed_other_audio(tts):
+    features = [make_features(tts, 40, seed=1)]
+    first = tts.infer_batch(features, 0, seeds=[123])[0]
+    second = tts.infer_batch(features, 0, seeds=[124])[0]
+    assert first.shape != second.shape or not np.array_equal(first, second)
+
+
+def test_seeded_sentence_independent_of_batch(tts):
+    features = [make_features(tts, n, seed=i) for i, n in enumerate([25, 60, 90])]
+    seeds = [7, 8, 9]
+    batched = tts.infer_batch(features, 0, seeds=seeds)
+    for feature, seed, audio in zip(features, seeds, batched):
+        alone = tts.infer_batch([feature], 0, seeds=[seed])[0]
+        assert audio.shape == alone.shape
+        np.testing.assert_allclose(audio, alone, rtol=0, atol=1e-5)